@@ -3,9 +3,112 @@ ReAct Agent 核心实现
 基于 Reasoning + Acting 循环的 Agent 架构
 """
 import json
-from typing import Optional
-from openai import OpenAI
-from tools import get_tools_for_llm, execute_tool, TOOLS
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from dataclasses import dataclass, field, asdict
+from types import SimpleNamespace
+from typing import Callable, Optional
+import httpx
+from openai import OpenAI, AsyncOpenAI
+from classifier import IntentClassifier
+from context import ContextManager, estimate_messages_tokens, estimate_tokens
+from llm_cache import ResponseCache, make_cache_key, message_to_dict
+from shell import ShellSession
+from tracing import Tracer, NULL_TRACER
+from tools import (
+    get_tools_for_llm,
+    get_tools_json,
+    get_registry_version,
+    select_tools,
+    execute_tool,
+    aexecute_tool,
+    is_parallel_safe,
+    use_shell_session,
+)
+
+
+def create_client(
+    api_key: str,
+    base_url: str,
+    max_connections: int = 100,
+    max_keepalive_connections: int = 20,
+    timeout: float = 120.0
+) -> OpenAI:
+    """
+    创建带连接池的 OpenAI 客户端，可在多个 Agent / 线程间共享
+    
+    Args:
+        api_key: API Key
+        base_url: API 基础 URL
+        max_connections: 连接池最大连接数
+        max_keepalive_connections: 保持 keep-alive 的空闲连接数
+        timeout: 请求超时（秒）
+    """
+    http_client = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections
+        ),
+        timeout=timeout
+    )
+    return OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+
+
+@functools.lru_cache(maxsize=64)
+def _render_system_prompt(template: str, tool_names: Optional[tuple[str, ...]], registry_version: int) -> str:
+    """
+    渲染系统提示，按 (模板, 工具子集, 注册表版本) 缓存
+    
+    同一配置下每次返回完全相同的字符串，保证 prompt 前缀字节一致，便于服务端命中 prompt 缓存。
+    """
+    tools_desc = "\n".join([
+        f"- **{name}**: {tool['description']}"
+        for name, tool in select_tools(tool_names).items()
+    ])
+    return template.format(tools_description=tools_desc)
+
+
+def _make_tool_call(call_id: str, name: str, arguments: str):
+    """构造与 OpenAI SDK 返回结构兼容的工具调用对象"""
+    return SimpleNamespace(
+        id=call_id,
+        type="function",
+        function=SimpleNamespace(name=name, arguments=arguments)
+    )
+
+
+def _make_message(content: Optional[str], tool_calls: list):
+    """构造与 OpenAI SDK 返回结构兼容的 assistant 消息对象"""
+    return SimpleNamespace(
+        role="assistant",
+        content=content,
+        tool_calls=tool_calls or None
+    )
+
+
+@dataclass
+class RunStats:
+    """单次 run/chat 的 token 用量与耗时统计"""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    iterations: int = 0
+    llm_calls: int = 0
+    # 命中响应缓存的 LLM 调用数，不计入 token 用量和预算
+    cache_hits: int = 0
+    tool_calls: int = 0
+    wall_time: float = 0.0
+    # 结束原因: completed / max_iterations / max_total_tokens / max_prompt_tokens / max_wall_time / cancelled
+    stop_reason: str = ""
+    # 每次迭代的用量: {"iteration", "prompt_tokens", "completion_tokens", "estimated", "cached"}
+    per_iteration: list[dict] = field(default_factory=list)
+    
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
 
 
 class ReActAgent:
@@ -46,7 +149,20 @@ class ReActAgent:
         base_url: str = "https://api.minimax.chat/v1",
         model: str = "MiniMax-M2.1",
         max_iterations: int = 10,
-        verbose: bool = True
+        verbose: bool = True,
+        parallel_tool_calls: bool = False,
+        max_workers: int = 4,
+        stream: bool = False,
+        on_token: Optional[Callable[[str], None]] = None,
+        context_manager: Optional[ContextManager] = None,
+        cache: Optional[ResponseCache] = None,
+        tracer: Optional[Tracer] = None,
+        max_total_tokens: Optional[int] = None,
+        max_prompt_tokens: Optional[int] = None,
+        max_wall_time: Optional[float] = None,
+        client: Optional[OpenAI] = None,
+        tools: Optional[list[str]] = None,
+        persistent_shell: bool = False
     ):
         """
         初始化 ReAct Agent
@@ -57,20 +173,64 @@ class ReActAgent:
             model: 模型名称
             max_iterations: 最大循环次数，防止无限循环
             verbose: 是否打印详细日志
+            parallel_tool_calls: 是否并发执行同一轮中的多个工具调用
+            max_workers: 并发执行工具时的最大线程数
+            stream: 是否使用流式输出，参数完整的工具调用会在流结束前提前执行（仅同步模式）
+            on_token: 流式模式下接收内容片段的回调
+            context_manager: 上下文管理器，每次调用 LLM 前按 token 预算压缩历史
+            cache: LLM 响应缓存，相同请求直接返回缓存的回复
+            tracer: 链路追踪器，记录运行/迭代/LLM 调用/工具调用的耗时
+            max_total_tokens: 单次运行的总 token 预算，超出后提前结束
+            max_prompt_tokens: 单次 LLM 调用的 prompt token 上限，超出后提前结束
+            max_wall_time: 单次运行的最长耗时（秒），超出后提前结束
+            client: 共享的 LLM 客户端（复用连接池），默认为每个 Agent 新建
+            tools: 可用工具名称列表，只向 LLM 发送这些工具，默认使用全部已注册工具
+            persistent_shell: bash 工具是否使用常驻 shell（保留 cwd/环境变量，省去每条命令的进程启动）
         """
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
+        self.client = client or self._create_client(api_key, base_url)
         self.model = model
+        # 校验工具名称，None 表示使用全部工具
+        self.tool_names: Optional[tuple[str, ...]] = tuple(select_tools(tools)) if tools is not None else None
         self.max_iterations = max_iterations
         self.verbose = verbose
+        self.parallel_tool_calls = parallel_tool_calls
+        self.max_workers = max_workers
+        self.stream = stream
+        self.on_token = on_token
+        self.context_manager = context_manager
+        self.cache = cache
+        self.tracer = tracer or NULL_TRACER
+        self.max_total_tokens = max_total_tokens
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_wall_time = max_wall_time
+        # 最近一次 run/chat 的统计
+        self.last_stats = RunStats()
+        self._run_started = 0.0
+        self.shell: Optional[ShellSession] = ShellSession() if persistent_shell else None
         self.messages: list[dict] = []
+        # 最近一次 LLM 调用的 token 用量（缓存命中或服务端未返回时为 None）
+        self._last_usage = None
+        # 最近一次 LLM 调用是否命中响应缓存
+        self._last_cache_hit = False
+        # 流式模式下提前执行的工具调用: tool_call_id -> Future
+        self._prefetched: dict[str, Future] = {}
+        self._stream_executor: Optional[ThreadPoolExecutor] = None
         
+    def _create_client(self, api_key: str, base_url: str):
+        """创建 LLM 客户端"""
+        return OpenAI(api_key=api_key, base_url=base_url)
+    
     def _get_system_prompt(self) -> str:
         """生成系统提示，包含工具描述"""
-        tools_desc = "\n".join([
-            f"- **{name}**: {tool['description']}"
-            for name, tool in TOOLS.items()
-        ])
-        return self.SYSTEM_PROMPT.format(tools_description=tools_desc)
+        return _render_system_prompt(self.SYSTEM_PROMPT, self.tool_names, get_registry_version())
+    
+    def _tool_schemas(self) -> list[dict]:
+        """发送给 LLM 的工具定义"""
+        return get_tools_for_llm(self.tool_names)
+    
+    def _tool_allowed(self, name: str) -> bool:
+        """工具是否在当前 Agent 的可用范围内"""
+        return self.tool_names is None or name in self.tool_names
     
     def _log(self, message: str, prefix: str = ""):
         """打印日志"""
@@ -81,32 +241,222 @@ class ReActAgent:
                 print('='*60)
             print(message)
     
+    def _compact_context(self):
+        """按 token 预算压缩对话历史"""
+        if self.context_manager:
+            self.messages = self.context_manager.compact(self.messages)
+    
+    def _cache_lookup(self) -> tuple[Optional[str], Optional[SimpleNamespace]]:
+        """查询响应缓存，返回 (缓存键, 命中的消息)；未启用缓存时键为 None"""
+        if self.cache is None:
+            return None, None
+        key = make_cache_key(self.model, self.messages, tools_json=get_tools_json(self.tool_names), tool_choice="auto")
+        cached = self.cache.get(key)
+        if cached is None:
+            return key, None
+        tool_calls = [
+            _make_tool_call(tc["id"], tc["name"], tc["arguments"])
+            for tc in cached["tool_calls"]
+        ]
+        return key, _make_message(cached["content"], tool_calls)
+    
     def _call_llm(self) -> dict:
         """调用 LLM"""
-        response = self.client.chat.completions.create(
+        with self.tracer.span("llm.call", **{"llm.model": self.model, "llm.stream": self.stream, "llm.messages": len(self.messages)}) as span:
+            self._last_usage = None
+            key, cached = self._cache_lookup()
+            self._last_cache_hit = cached is not None
+            if cached is not None:
+                span.set(**{"llm.cache_hit": True})
+                if self.stream and self.on_token and cached.content:
+                    self.on_token(cached.content)
+                return cached
+            
+            if self.stream:
+                message = self._call_llm_stream()
+            else:
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=self.messages,
+                    tools=self._tool_schemas(),
+                    tool_choice="auto"
+                )
+                self._last_usage = getattr(response, "usage", None)
+                message = response.choices[0].message
+            
+            self._trace_llm_result(span, message)
+            if key is not None:
+                self.cache.put(key, message_to_dict(message))
+            return message
+    
+    def _trace_llm_result(self, span, message):
+        """记录 LLM 调用的 token 用量和回复大小"""
+        usage = self._last_usage
+        span.set(**{
+            "llm.cache_hit": False,
+            "llm.usage.prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "llm.usage.completion_tokens": getattr(usage, "completion_tokens", None),
+            "llm.usage.total_tokens": getattr(usage, "total_tokens", None),
+            "llm.response.size": len(message.content or ""),
+            "llm.tool_calls": len(message.tool_calls or []),
+        })
+    
+    def _call_llm_stream(self):
+        """
+        流式调用 LLM
+        
+        内容片段实时交给 on_token 回调；某个工具调用的参数 JSON 一旦完整，
+        且它及之前的调用都可并发执行，就立即提交到线程池，不等整条消息结束。
+        """
+        stream = self.client.chat.completions.create(
             model=self.model,
             messages=self.messages,
-            tools=get_tools_for_llm(),
-            tool_choice="auto"
+            tools=self._tool_schemas(),
+            tool_choice="auto",
+            stream=True,
+            # 让服务端在最后一个分块中返回 token 用量，供预算统计和链路追踪使用
+            stream_options={"include_usage": True}
         )
-        return response.choices[0].message
+        
+        content_parts: list[str] = []
+        calls: dict[int, dict] = {}
+        # 之前的调用中出现不可并发的工具后，后续调用不再提前执行
+        early_dispatch = True
+        
+        def try_dispatch():
+            nonlocal early_dispatch
+            for index in sorted(calls):
+                entry = calls[index]
+                if entry["future"] is not None:
+                    continue
+                if not early_dispatch or not entry["id"] or not entry["name"]:
+                    return
+                if not is_parallel_safe(entry["name"]):
+                    early_dispatch = False
+                    return
+                try:
+                    arguments = json.loads(entry["arguments"])
+                except json.JSONDecodeError:
+                    return
+                tool_call = _make_tool_call(entry["id"], entry["name"], entry["arguments"])
+                entry["future"] = self._get_stream_executor().submit(
+                    contextvars.copy_context().run, self._execute_tool_call, tool_call, arguments
+                )
+                self._prefetched[entry["id"]] = entry["future"]
+        
+        for chunk in stream:
+            # 用量在最后一个分块中返回（choices 为空）
+            if getattr(chunk, "usage", None):
+                self._last_usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content_parts.append(delta.content)
+                if self.on_token:
+                    self.on_token(delta.content)
+            for tc in delta.tool_calls or []:
+                entry = calls.setdefault(
+                    tc.index, {"id": None, "name": "", "arguments": "", "future": None}
+                )
+                if tc.id:
+                    entry["id"] = tc.id
+                if tc.function:
+                    entry["name"] += tc.function.name or ""
+                    entry["arguments"] += tc.function.arguments or ""
+            if delta.tool_calls:
+                try_dispatch()
+        
+        tool_calls = [
+            _make_tool_call(entry["id"], entry["name"], entry["arguments"])
+            for _, entry in sorted(calls.items())
+        ]
+        return _make_message("".join(content_parts) or None, tool_calls)
+    
+    def _get_stream_executor(self) -> ThreadPoolExecutor:
+        """流式提前执行工具使用的线程池，串行模式下只有一个线程以保持顺序"""
+        if self._stream_executor is None:
+            workers = self.max_workers if self.parallel_tool_calls else 1
+            self._stream_executor = ThreadPoolExecutor(max_workers=workers)
+        return self._stream_executor
+    
+    @staticmethod
+    def _parse_arguments(tool_call) -> dict:
+        """解析工具调用参数，非法 JSON 视为空参数"""
+        try:
+            return json.loads(tool_call.function.arguments)
+        except json.JSONDecodeError:
+            return {}
+    
+    def _log_tool_call(self, tool_call, arguments: dict):
+        """打印工具调用"""
+        self._log(f"工具: {tool_call.function.name}\n参数: {json.dumps(arguments, ensure_ascii=False, indent=2)}", "工具调用")
+    
+    def _log_tool_result(self, result: str):
+        """打印工具结果（截断）"""
+        self._log(f"{result[:500]}{'...(截断)' if len(result) > 500 else ''}", "工具结果")
+    
+    def _execute_tool_call(self, tool_call, arguments: dict) -> str:
+        """执行单个工具调用"""
+        with self.tracer.span("tool.execute", **{
+            "tool.name": tool_call.function.name,
+            "tool.arguments.size": len(tool_call.function.arguments or "")
+        }) as span:
+            if self._tool_allowed(tool_call.function.name):
+                with use_shell_session(self.shell):
+                    result = execute_tool(tool_call.function.name, arguments)
+            else:
+                result = f"[错误]: 工具 '{tool_call.function.name}' 不可用"
+            span.set(**{"tool.result.size": len(result)})
+            return result
+    
+    def _run_tool_call(self, tool_call, arguments: dict) -> str:
+        """获取工具调用结果，优先使用流式阶段已提前执行的结果"""
+        future = self._prefetched.pop(tool_call.id, None)
+        if future is not None:
+            return future.result()
+        return self._execute_tool_call(tool_call, arguments)
+    
+    def _discard_prefetched(self):
+        """取消尚未开始的提前执行，并等待已开始的完成，避免工具在本次运行结束后继续执行"""
+        prefetched, self._prefetched = self._prefetched, {}
+        running = [future for future in prefetched.values() if not future.cancel()]
+        if running:
+            wait(running)
+    
+    @staticmethod
+    def _assistant_message(response) -> dict:
+        """将包含工具调用的 LLM 回复转换为 assistant 消息"""
+        return {
+            "role": "assistant",
+            "content": response.content or "",
+            "tool_calls": [
+                {
+                    "id": tc.id,
+                    "type": "function",
+                    "function": {
+                        "name": tc.function.name,
+                        "arguments": tc.function.arguments
+                    }
+                }
+                for tc in response.tool_calls
+            ]
+        }
     
     def _handle_tool_calls(self, tool_calls: list) -> list[dict]:
         """处理工具调用"""
+        if self.parallel_tool_calls and len(tool_calls) > 1:
+            return self._handle_tool_calls_parallel(tool_calls)
+        
         results = []
         for tool_call in tool_calls:
-            tool_name = tool_call.function.name
-            try:
-                arguments = json.loads(tool_call.function.arguments)
-            except json.JSONDecodeError:
-                arguments = {}
-            
-            self._log(f"工具: {tool_name}\n参数: {json.dumps(arguments, ensure_ascii=False, indent=2)}", "工具调用")
+            arguments = self._parse_arguments(tool_call)
+            self._log_tool_call(tool_call, arguments)
             
             # 执行工具
-            result = execute_tool(tool_name, arguments)
+            result = self._run_tool_call(tool_call, arguments)
             
-            self._log(f"{result[:500]}{'...(截断)' if len(result) > 500 else ''}", "工具结果")
+            self._log_tool_result(result)
             
             results.append({
                 "role": "tool",
@@ -116,6 +466,162 @@ class ReActAgent:
         
         return results
     
+    def _handle_tool_calls_parallel(self, tool_calls: list) -> list[dict]:
+        """
+        并发处理工具调用
+        
+        连续的可并发工具作为一批提交到线程池；不可并发的工具（如 write_file）
+        作为屏障单独执行，保证其与前后调用的先后顺序不变。
+        返回结果的顺序与 tool_calls 保持一致。
+        """
+        parsed = [(tc, self._parse_arguments(tc)) for tc in tool_calls]
+        for tool_call, arguments in parsed:
+            self._log_tool_call(tool_call, arguments)
+        
+        outputs: list[Optional[str]] = [None] * len(parsed)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            batch: list[int] = []
+            
+            def flush():
+                futures = {
+                    i: executor.submit(contextvars.copy_context().run, self._run_tool_call, *parsed[i])
+                    for i in batch
+                }
+                for i, future in futures.items():
+                    outputs[i] = future.result()
+                batch.clear()
+            
+            for i, (tool_call, arguments) in enumerate(parsed):
+                if is_parallel_safe(tool_call.function.name):
+                    batch.append(i)
+                else:
+                    flush()
+                    outputs[i] = self._run_tool_call(tool_call, arguments)
+            flush()
+        
+        results = []
+        for (tool_call, _), result in zip(parsed, outputs):
+            self._log_tool_result(result)
+            results.append({
+                "role": "tool",
+                "tool_call_id": tool_call.id,
+                "content": result
+            })
+        
+        return results
+    
+    def _start_stats(self):
+        """开始一次运行的统计"""
+        self.last_stats = RunStats()
+        self._run_started = time.monotonic()
+    
+    def _finish_stats(self, stop_reason: str):
+        """结束一次运行的统计"""
+        self.last_stats.stop_reason = stop_reason
+        self.last_stats.wall_time = time.monotonic() - self._run_started
+    
+    def _check_budget_before_call(self) -> Optional[str]:
+        """调用 LLM 前检查预算，超出时返回结束原因"""
+        if self.max_wall_time is not None and time.monotonic() - self._run_started >= self.max_wall_time:
+            return "max_wall_time"
+        if self.max_total_tokens is not None and self.last_stats.total_tokens >= self.max_total_tokens:
+            return "max_total_tokens"
+        if self.max_prompt_tokens is not None and estimate_messages_tokens(self.messages) > self.max_prompt_tokens:
+            return "max_prompt_tokens"
+        return None
+    
+    def _record_usage(self, iteration: int, message):
+        """累计本次 LLM 调用的 token 用量，服务端未返回用量时按估算值计；命中缓存时不消耗 token"""
+        usage = self._last_usage
+        cached = self._last_cache_hit
+        estimated = usage is None and not cached
+        if cached:
+            prompt_tokens = completion_tokens = 0
+        elif estimated:
+            prompt_tokens = estimate_messages_tokens(self.messages)
+            completion_tokens = estimate_tokens(message.content or "") + sum(
+                estimate_tokens(tc.function.arguments or "") for tc in message.tool_calls or []
+            )
+        else:
+            prompt_tokens = usage.prompt_tokens or 0
+            completion_tokens = usage.completion_tokens or 0
+        
+        stats = self.last_stats
+        stats.iterations = iteration
+        stats.llm_calls += 1
+        stats.cache_hits += cached
+        stats.prompt_tokens += prompt_tokens
+        stats.completion_tokens += completion_tokens
+        stats.per_iteration.append({
+            "iteration": iteration,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "estimated": estimated,
+            "cached": cached
+        })
+    
+    def _budget_exceeded_answer(self, reason: str) -> str:
+        """预算耗尽时的结果"""
+        stats = self.last_stats
+        details = {
+            "max_total_tokens": f"总 token {stats.total_tokens}/{self.max_total_tokens}",
+            "max_prompt_tokens": f"prompt 超出单次上限 {self.max_prompt_tokens}",
+            "max_wall_time": f"耗时超出 {self.max_wall_time} 秒",
+        }
+        answer = f"[警告]: 超出预算（{details[reason]}），任务已提前终止"
+        self._log(answer, "预算")
+        return answer
+    
+    def _loop(self, final_log_prefix: str, record_answer: bool) -> Optional[str]:
+        """ReAct 主循环，返回 None 表示达到最大迭代次数"""
+        try:
+            iteration = 0
+            while iteration < self.max_iterations:
+                iteration += 1
+                with self.tracer.span("agent.iteration", iteration=iteration):
+                    self._log(f"", f"迭代 {iteration}/{self.max_iterations}")
+                    
+                    # 先压缩上下文，预算按实际发送的消息检查
+                    self._compact_context()
+                    reason = self._check_budget_before_call()
+                    if reason:
+                        self._finish_stats(reason)
+                        return self._budget_exceeded_answer(reason)
+                    
+                    # 调用 LLM
+                    response = self._call_llm()
+                    self._record_usage(iteration, response)
+                    
+                    # 检查是否有工具调用
+                    if response.tool_calls:
+                        # 用完总预算时不再执行工具
+                        if self.max_total_tokens is not None and self.last_stats.total_tokens >= self.max_total_tokens:
+                            self._finish_stats("max_total_tokens")
+                            return self._budget_exceeded_answer("max_total_tokens")
+                        
+                        # 添加 assistant 消息（包含工具调用）
+                        self.messages.append(self._assistant_message(response))
+                        
+                        # 执行工具并添加结果
+                        tool_results = self._handle_tool_calls(response.tool_calls)
+                        self.messages.extend(tool_results)
+                        self.last_stats.tool_calls += len(tool_results)
+                        
+                    else:
+                        # 没有工具调用，返回最终回答
+                        final_answer = response.content or "[无回答]"
+                        if record_answer:
+                            self.messages.append({"role": "assistant", "content": final_answer})
+                        self._log(final_answer, final_log_prefix)
+                        self._finish_stats("completed")
+                        return final_answer
+            
+            self._finish_stats("max_iterations")
+            return None
+        finally:
+            # 预算检查等提前结束时，流式阶段提前提交的工具调用可能还没有被使用
+            self._discard_prefetched()
+    
     def run(self, user_input: str) -> str:
         """
         运行 ReAct 循环
@@ -126,53 +632,35 @@ class ReActAgent:
         Returns:
             最终回答
         """
-        # 初始化消息
-        self.messages = [
-            {"role": "system", "content": self._get_system_prompt()},
-            {"role": "user", "content": user_input}
-        ]
-        
-        self._log(f"用户输入: {user_input}", "开始任务")
-        
-        iteration = 0
-        while iteration < self.max_iterations:
-            iteration += 1
-            self._log(f"", f"迭代 {iteration}/{self.max_iterations}")
+        with self.tracer.span("agent.run", **{"agent.model": self.model, "agent.mode": "run", "input.size": len(user_input)}) as span:
+            self._start_stats()
+            # 初始化消息
+            self.messages = [
+                {"role": "system", "content": self._get_system_prompt()},
+                {"role": "user", "content": user_input}
+            ]
             
-            # 调用 LLM
-            response = self._call_llm()
+            self._log(f"用户输入: {user_input}", "开始任务")
             
-            # 检查是否有工具调用
-            if response.tool_calls:
-                # 添加 assistant 消息（包含工具调用）
-                self.messages.append({
-                    "role": "assistant",
-                    "content": response.content or "",
-                    "tool_calls": [
-                        {
-                            "id": tc.id,
-                            "type": "function",
-                            "function": {
-                                "name": tc.function.name,
-                                "arguments": tc.function.arguments
-                            }
-                        }
-                        for tc in response.tool_calls
-                    ]
-                })
-                
-                # 执行工具并添加结果
-                tool_results = self._handle_tool_calls(response.tool_calls)
-                self.messages.extend(tool_results)
-                
-            else:
-                # 没有工具调用，返回最终回答
-                final_answer = response.content or "[无回答]"
-                self._log(final_answer, "最终回答")
-                return final_answer
+            answer = self._loop("最终回答", record_answer=False)
+            # 超过最大迭代次数
+            if answer is None:
+                answer = "[警告]: 达到最大迭代次数，任务可能未完成"
+            span.set(**{"output.size": len(answer), "tokens.total": self.last_stats.total_tokens})
+            return answer
+    
+    def run_with_stats(self, user_input: str) -> tuple[str, RunStats]:
+        """
+        运行 ReAct 循环并返回本次运行的统计
         
-        # 超过最大迭代次数
-        return "[警告]: 达到最大迭代次数，任务可能未完成"
+        Args:
+            user_input: 用户输入
+            
+        Returns:
+            (最终回答, RunStats)
+        """
+        answer = self.run(user_input)
+        return answer, self.last_stats
     
     def chat(self, user_input: str) -> str:
         """
@@ -184,62 +672,340 @@ class ReActAgent:
         Returns:
             回答
         """
-        # 如果是新对话，初始化系统提示
-        if not self.messages:
-            self.messages = [
-                {"role": "system", "content": self._get_system_prompt()}
-            ]
+        with self.tracer.span("agent.run", **{"agent.model": self.model, "agent.mode": "chat", "input.size": len(user_input)}) as span:
+            self._start_stats()
+            # 如果是新对话，初始化系统提示
+            if not self.messages:
+                self.messages = [
+                    {"role": "system", "content": self._get_system_prompt()}
+                ]
+            
+            # 添加用户消息
+            self.messages.append({"role": "user", "content": user_input})
+            
+            self._log(f"用户: {user_input}", "对话")
+            
+            answer = self._loop("回答", record_answer=True)
+            if answer is None:
+                answer = "[警告]: 达到最大迭代次数"
+            span.set(**{"output.size": len(answer), "tokens.total": self.last_stats.total_tokens})
+            return answer
+    
+    def reset(self):
+        """重置对话历史，常驻 shell 会被关闭并在下次使用时重新启动"""
+        self.messages = []
+        self._discard_prefetched()
+        if self.shell is not None:
+            self.shell.close()
+
+
+@dataclass
+class BatchResult:
+    """run_many 的结果，results 与输入任务顺序一致"""
+    # 每项: {"index", "task", "answer", "error", "stats"}
+    results: list[dict]
+    wall_time: float
+    
+    @property
+    def succeeded(self) -> int:
+        return sum(1 for r in self.results if r["error"] is None)
+    
+    @property
+    def throughput(self) -> float:
+        """每秒完成的任务数"""
+        return len(self.results) / self.wall_time if self.wall_time > 0 else 0.0
+    
+    @property
+    def total_tokens(self) -> int:
+        return sum(r["stats"]["prompt_tokens"] + r["stats"]["completion_tokens"] for r in self.results if r["stats"])
+
+
+def run_many(
+    tasks: list[str],
+    concurrency: int = 4,
+    *,
+    api_key: str,
+    base_url: str = "https://api.minimax.chat/v1",
+    model: str = "MiniMax-M2.1",
+    client: Optional[OpenAI] = None,
+    on_result: Optional[Callable[[dict], None]] = None,
+    **agent_kwargs
+) -> BatchResult:
+    """
+    并发处理一批相互独立的任务
+    
+    每个任务使用独立的 ReActAgent（上下文互不影响），所有 Agent 共享同一个客户端连接池。
+    
+    Args:
+        tasks: 任务列表
+        concurrency: 同时运行的任务数
+        api_key: API Key
+        base_url: API 基础 URL
+        model: 模型名称
+        client: 共享的客户端，默认按 concurrency 创建带连接池的客户端（批次结束后关闭）
+        on_result: 每个任务完成时的回调（完成顺序，可用于进度显示）
+        **agent_kwargs: 传给 ReActAgent 的其他参数
+        
+    Returns:
+        BatchResult，results 顺序与 tasks 一致
+    """
+    owns_client = client is None
+    if owns_client:
+        # 每个并发任务至少保留一条 keep-alive 连接，避免批次内反复建连
+        client = create_client(
+            api_key, base_url,
+            max_connections=max(concurrency, 1) * 2,
+            max_keepalive_connections=max(concurrency, 20)
+        )
+    agent_kwargs.setdefault("verbose", False)
+    
+    def run_one(index: int, task: str) -> dict:
+        agent = ReActAgent(api_key=api_key, base_url=base_url, model=model, client=client, **agent_kwargs)
+        item = {"index": index, "task": task, "answer": None, "error": None, "stats": None}
+        try:
+            item["answer"] = agent.run(task)
+        except Exception as e:
+            item["error"] = f"{type(e).__name__}: {e}"
+        item["stats"] = asdict(agent.last_stats)
+        if on_result:
+            on_result(item)
+        return item
+    
+    start = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+            futures = [executor.submit(run_one, i, task) for i, task in enumerate(tasks)]
+            results = [f.result() for f in futures]
+    finally:
+        # 自行创建的客户端用完即关闭，释放连接池
+        if owns_client:
+            client.close()
+    
+    return BatchResult(results=results, wall_time=time.monotonic() - start)
+
+
+class AsyncReActAgent(ReActAgent):
+    """
+    异步 ReAct Agent
+    
+    基于 AsyncOpenAI 客户端，适合在单个进程内承载大量并发会话：
+    - 同步工具放到线程池执行，协程工具直接 await
+    - 调用 cancel() 后在下一个检查点（LLM 调用前、工具执行前）停止
+    - 所在 Task 被取消时，未完成的工具调用会补上取消结果，保证上下文合法
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cancelled = False
+    
+    def _create_client(self, api_key: str, base_url: str):
+        """创建异步 LLM 客户端"""
+        return AsyncOpenAI(api_key=api_key, base_url=base_url)
+    
+    def cancel(self):
+        """请求协作式取消，当前循环会在下一个检查点结束"""
+        self._cancelled = True
+    
+    async def _acall_llm(self):
+        """异步调用 LLM"""
+        with self.tracer.span("llm.call", **{"llm.model": self.model, "llm.stream": False, "llm.messages": len(self.messages)}) as span:
+            self._last_usage = None
+            # SQLite 读写放到线程中执行，不阻塞事件循环
+            key, cached = await asyncio.to_thread(self._cache_lookup) if self.cache is not None else (None, None)
+            self._last_cache_hit = cached is not None
+            if cached is not None:
+                span.set(**{"llm.cache_hit": True})
+                return cached
+            
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=self.messages,
+                tools=self._tool_schemas(),
+                tool_choice="auto"
+            )
+            self._last_usage = getattr(response, "usage", None)
+            message = response.choices[0].message
+            self._trace_llm_result(span, message)
+            if key is not None:
+                await asyncio.to_thread(self.cache.put, key, message_to_dict(message))
+            return message
+    
+    async def _aexecute_tool_call(self, tool_call, arguments: dict) -> str:
+        """异步执行单个工具调用"""
+        with self.tracer.span("tool.execute", **{
+            "tool.name": tool_call.function.name,
+            "tool.arguments.size": len(tool_call.function.arguments or "")
+        }) as span:
+            if self._tool_allowed(tool_call.function.name):
+                with use_shell_session(self.shell):
+                    result = await aexecute_tool(tool_call.function.name, arguments)
+            else:
+                result = f"[错误]: 工具 '{tool_call.function.name}' 不可用"
+            span.set(**{"tool.result.size": len(result)})
+            return result
+    
+    async def _ahandle_tool_calls(self, tool_calls: list) -> list[dict]:
+        """
+        异步处理工具调用
+        
+        开启 parallel_tool_calls 时，连续的可并发工具通过 asyncio.gather 并发执行，
+        不可并发的工具作为屏障单独执行；返回顺序与 tool_calls 保持一致。
+        """
+        parsed = [(tc, self._parse_arguments(tc)) for tc in tool_calls]
+        for tool_call, arguments in parsed:
+            self._log_tool_call(tool_call, arguments)
+        
+        outputs: list[Optional[str]] = [None] * len(parsed)
+        semaphore = asyncio.Semaphore(self.max_workers)
         
-        # 添加用户消息
-        self.messages.append({"role": "user", "content": user_input})
+        async def run_one(i: int):
+            async with semaphore:
+                outputs[i] = await self._aexecute_tool_call(*parsed[i])
         
-        self._log(f"用户: {user_input}", "对话")
+        try:
+            batch: list[int] = []
+            for i, (tool_call, _) in enumerate(parsed):
+                if self._cancelled:
+                    break
+                if self.parallel_tool_calls and is_parallel_safe(tool_call.function.name):
+                    batch.append(i)
+                    continue
+                if batch:
+                    await asyncio.gather(*(run_one(j) for j in batch))
+                    batch = []
+                await run_one(i)
+            if batch:
+                await asyncio.gather(*(run_one(j) for j in batch))
+        finally:
+            # 被取消时补齐结果，保证每个 tool_call_id 都有对应的 tool 消息
+            results = []
+            for (tool_call, _), result in zip(parsed, outputs):
+                if result is None:
+                    result = "[已取消]: 工具未执行完成"
+                self._log_tool_result(result)
+                results.append({
+                    "role": "tool",
+                    "tool_call_id": tool_call.id,
+                    "content": result
+                })
+            self.messages.extend(results)
         
+        return results
+    
+    async def _aloop(self, final_log_prefix: str, record_answer: bool) -> Optional[str]:
+        """异步 ReAct 主循环，返回 None 表示达到最大迭代次数"""
         iteration = 0
         while iteration < self.max_iterations:
             iteration += 1
+            if self._cancelled:
+                self._finish_stats("cancelled")
+                return "[已取消]: 任务被取消"
+            with self.tracer.span("agent.iteration", iteration=iteration):
+                self._log(f"", f"迭代 {iteration}/{self.max_iterations}")
+                
+                # 先压缩上下文，预算按实际发送的消息检查
+                self._compact_context()
+                reason = self._check_budget_before_call()
+                if reason:
+                    self._finish_stats(reason)
+                    return self._budget_exceeded_answer(reason)
+                
+                response = await self._acall_llm()
+                self._record_usage(iteration, response)
+                
+                if response.tool_calls:
+                    if self.max_total_tokens is not None and self.last_stats.total_tokens >= self.max_total_tokens:
+                        self._finish_stats("max_total_tokens")
+                        return self._budget_exceeded_answer("max_total_tokens")
+                    self.messages.append(self._assistant_message(response))
+                    tool_results = await self._ahandle_tool_calls(response.tool_calls)
+                    self.last_stats.tool_calls += len(tool_results)
+                else:
+                    final_answer = response.content or "[无回答]"
+                    if record_answer:
+                        self.messages.append({"role": "assistant", "content": final_answer})
+                    self._log(final_answer, final_log_prefix)
+                    self._finish_stats("completed")
+                    return final_answer
+        
+        self._finish_stats("max_iterations")
+        return None
+    
+    async def arun(self, user_input: str) -> str:
+        """
+        异步运行 ReAct 循环
+        
+        Args:
+            user_input: 用户输入
             
-            # 调用 LLM
-            response = self._call_llm()
+        Returns:
+            最终回答
+        """
+        with self.tracer.span("agent.run", **{"agent.model": self.model, "agent.mode": "arun", "input.size": len(user_input)}) as span:
+            self._cancelled = False
+            self._start_stats()
+            self.messages = [
+                {"role": "system", "content": self._get_system_prompt()},
+                {"role": "user", "content": user_input}
+            ]
             
-            if response.tool_calls:
-                # 处理工具调用
-                self.messages.append({
-                    "role": "assistant",
-                    "content": response.content or "",
-                    "tool_calls": [
-                        {
-                            "id": tc.id,
-                            "type": "function",
-                            "function": {
-                                "name": tc.function.name,
-                                "arguments": tc.function.arguments
-                            }
-                        }
-                        for tc in response.tool_calls
-                    ]
-                })
-                
-                tool_results = self._handle_tool_calls(response.tool_calls)
-                self.messages.extend(tool_results)
-            else:
-                # 最终回答
-                final_answer = response.content or "[无回答]"
-                self.messages.append({"role": "assistant", "content": final_answer})
-                self._log(f"助手: {final_answer}", "回答")
-                return final_answer
+            self._log(f"用户输入: {user_input}", "开始任务")
+            
+            answer = await self._aloop("最终回答", record_answer=False)
+            if answer is None:
+                answer = "[警告]: 达到最大迭代次数，任务可能未完成"
+            span.set(**{"output.size": len(answer), "tokens.total": self.last_stats.total_tokens})
+            return answer
+    
+    async def arun_with_stats(self, user_input: str) -> tuple[str, RunStats]:
+        """
+        异步运行 ReAct 循环并返回本次运行的统计
         
-        return "[警告]: 达到最大迭代次数"
+        Args:
+            user_input: 用户输入
+            
+        Returns:
+            (最终回答, RunStats)
+        """
+        answer = await self.arun(user_input)
+        return answer, self.last_stats
     
-    def reset(self):
-        """重置对话历史"""
-        self.messages = []
+    async def achat(self, user_input: str) -> str:
+        """
+        异步对话模式 - 保持上下文
+        
+        Args:
+            user_input: 用户输入
+            
+        Returns:
+            回答
+        """
+        with self.tracer.span("agent.run", **{"agent.model": self.model, "agent.mode": "achat", "input.size": len(user_input)}) as span:
+            self._cancelled = False
+            self._start_stats()
+            if not self.messages:
+                self.messages = [
+                    {"role": "system", "content": self._get_system_prompt()}
+                ]
+            
+            self.messages.append({"role": "user", "content": user_input})
+            
+            self._log(f"用户: {user_input}", "对话")
+            
+            answer = await self._aloop("回答", record_answer=True)
+            if answer is None:
+                answer = "[警告]: 达到最大迭代次数"
+            span.set(**{"output.size": len(answer), "tokens.total": self.last_stats.total_tokens})
+            return answer
 
 
 class MultiAgentRouter:
     """
     多 Agent 路由器
     根据用户意图选择合适的专门化 Agent
+    
+    路由器与所有专门化 Agent 共享同一个带连接池的客户端；
+    每种类型的 Agent 用完后重置并放回池中复用，而不是每次重新创建。
     """
     
     ROUTER_PROMPT = """你是一个任务分类专家。分析用户请求，返回最合适的 agent 类型。
@@ -252,15 +1018,43 @@ class MultiAgentRouter:
 
 只返回一个单词：explore/code/bash/general"""
 
-    def __init__(self, api_key: str, base_url: str = "https://api.moonshot.cn/v1"):
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://api.moonshot.cn/v1",
+        client: Optional[OpenAI] = None,
+        pool_size: int = 4,
+        router_model: str = "moonshot-v1-8k",
+        classifier: Optional[IntentClassifier] = None,
+        decision_log: Optional[str] = None
+    ):
+        """
+        初始化路由器
+        
+        Args:
+            api_key: API Key
+            base_url: API 基础 URL
+            client: 共享的客户端，默认创建带连接池的客户端
+            pool_size: 每种类型最多缓存的空闲 Agent 数
+            router_model: 本地分类器不够确定时用于分类的模型
+            classifier: 本地意图分类器，默认仅使用关键词规则
+            decision_log: LLM 分类决策的日志文件 (JSONL)，可用 IntentClassifier.fit_from_log 训练本地模型
+        """
+        self.client = client or create_client(api_key, base_url)
         self.api_key = api_key
         self.base_url = base_url
+        self.pool_size = pool_size
+        self.router_model = router_model
+        self.classifier = classifier or IntentClassifier()
+        self.decision_log = decision_log
+        self._log_lock = threading.Lock()
+        self._pools: dict[str, list[ReActAgent]] = {}
+        self._pool_lock = threading.Lock()
         
         # 专门化 Agent 的系统提示
         self.agent_prompts = {
             "explore": """你是代码探索专家。擅长搜索文件、理解代码结构。
-主要使用: list_dir, read_file, search_files 工具。
+主要使用: list_dir, read_file, search_files, grep 工具。
 风格: 直接给出发现，提供清晰的文件路径。""",
             
             "code": """你是代码编写专家。擅长创建和修改代码。
@@ -274,11 +1068,37 @@ class MultiAgentRouter:
             "general": """你是通用助手。可以使用所有工具完成各种任务。
 根据需要灵活选择合适的工具。"""
         }
+        
+        # 专门化 Agent 的可用工具，只发送这些工具的定义以减少 prompt；None 表示全部工具
+        self.agent_tools: dict[str, Optional[list[str]]] = {
+            "explore": ["list_dir", "read_file", "search_files", "grep"],
+            "code": ["read_file", "write_file"],
+            "bash": ["bash", "job_start", "job_status", "job_output", "job_wait", "job_kill"],
+            "general": None
+        }
     
     def classify(self, user_input: str) -> str:
-        """分类用户请求"""
+        """分类用户请求，本地分类器足够确定时不调用 LLM"""
+        local = self.classifier.classify(user_input)
+        if local is not None:
+            return local[0]
+        
+        agent_type = self._classify_llm(user_input)
+        self._log_decision(user_input, agent_type)
+        return agent_type
+    
+    def _log_decision(self, user_input: str, agent_type: str):
+        """记录 LLM 分类决策，用于训练本地模型"""
+        if not self.decision_log:
+            return
+        with self._log_lock:
+            with open(self.decision_log, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"input": user_input, "label": agent_type}, ensure_ascii=False) + "\n")
+    
+    def _classify_llm(self, user_input: str) -> str:
+        """使用 LLM 分类用户请求"""
         response = self.client.chat.completions.create(
-            model="moonshot-v1-8k",
+            model=self.router_model,
             messages=[
                 {"role": "system", "content": self.ROUTER_PROMPT},
                 {"role": "user", "content": user_input}
@@ -307,16 +1127,39 @@ class MultiAgentRouter:
         agent_type = self.classify(user_input)
         print(f"\n[路由器] 选择 Agent: {agent_type}")
         
-        # 创建专门化 Agent
+        # 从池中取出专门化 Agent 执行，完成后放回
+        agent = self._acquire(agent_type)
+        try:
+            return agent.run(user_input)
+        finally:
+            self._release(agent_type, agent)
+    
+    def _create_agent(self, agent_type: str) -> ReActAgent:
+        """创建专门化 Agent，共享路由器的客户端"""
         agent = ReActAgent(
             api_key=self.api_key,
-            base_url=self.base_url
+            base_url=self.base_url,
+            client=self.client,
+            tools=self.agent_tools.get(agent_type)
         )
         
         # 修改系统提示
-        original_prompt = agent._get_system_prompt()
         specialized_prompt = self.agent_prompts[agent_type]
-        agent.SYSTEM_PROMPT = f"{specialized_prompt}\n\n{original_prompt}"
-        
-        # 执行
-        return agent.run(user_input)
+        agent.SYSTEM_PROMPT = f"{specialized_prompt}\n\n{ReActAgent.SYSTEM_PROMPT}"
+        return agent
+    
+    def _acquire(self, agent_type: str) -> ReActAgent:
+        """从池中取出一个空闲 Agent，没有则新建"""
+        with self._pool_lock:
+            pool = self._pools.setdefault(agent_type, [])
+            if pool:
+                return pool.pop()
+        return self._create_agent(agent_type)
+    
+    def _release(self, agent_type: str, agent: ReActAgent):
+        """重置 Agent 并放回池中"""
+        agent.reset()
+        with self._pool_lock:
+            pool = self._pools.setdefault(agent_type, [])
+            if len(pool) < self.pool_size:
+                pool.append(agent)
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+基准测试模块 - Agent 循环开销与内置工具的微基准
+结果以 JSON 输出（p50/p95/p99），可与基线文件对比并在性能回退时返回非零退出码
+
+用法:
+    python bench.py --files 10000 --output result.json
+    python bench.py --baseline result.json --tolerance 0.2
+    python main.py bench ...
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Callable, Optional
+
+from mock_server import MockLLM
+from tools import (
+    bash_tool,
+    calculator_tool,
+    list_dir_tool,
+    read_file_tool,
+    search_files_tool,
+)
+
+
+class ScriptedClient:
+    """
+    进程内的脚本化 LLM 客户端，接口与 OpenAI 客户端的 chat.completions.create 兼容
+
+    不经过网络，用于单独测量 Agent 自身的循环开销。
+    """
+
+    def __init__(self, script: dict):
+        self.llm = MockLLM(script)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, messages: list[dict], **kwargs):
+        content, tool_calls = self.llm.reply(messages)
+        message = SimpleNamespace(
+            role="assistant",
+            content=content,
+            tool_calls=[
+                SimpleNamespace(
+                    id=tc["id"],
+                    type="function",
+                    function=SimpleNamespace(**tc["function"])
+                )
+                for tc in tool_calls
+            ] or None
+        )
+        usage = SimpleNamespace(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=usage)
+
+
+def loop_script(iterations: int) -> dict:
+    """生成一条先调用 iterations 次计算器、再给出最终回答的轨迹"""
+    step = {"tool_calls": [{"name": "calculator", "arguments": {"expression": "1 + 1"}}]}
+    return {
+        "trajectories": [{
+            "match": "",
+            "steps": [step] * iterations + [{"content": "done"}]
+        }]
+    }
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """最近秩法计算百分位数"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+def summarize(samples: list[float]) -> dict:
+    """汇总耗时样本（秒）"""
+    values = sorted(samples)
+    return {
+        "n": len(values),
+        "mean": sum(values) / len(values) if values else 0.0,
+        "min": values[0] if values else 0.0,
+        "max": values[-1] if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+    }
+
+
+def measure(func: Callable[[], object], repeat: int, warmup: int = 1) -> dict:
+    """重复执行 func 并统计耗时"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def make_fixture_tree(root: str, n_files: int, fanout: int = 100) -> dict:
+    """
+    生成测试目录树
+
+    文件均匀分布在两层目录中，每个目录最多 fanout 个文件，约 1/5 为 .py 文件。
+
+    Returns:
+        fixture 信息：根目录、一个大目录、一个示例文件
+    """
+    marker = os.path.join(root, ".bench_fixture.json")
+    if os.path.exists(marker):
+        with open(marker, "r", encoding="utf-8") as f:
+            info = json.load(f)
+        if info.get("files") == n_files and info.get("fanout") == fanout:
+            return info
+
+    per_dir = max(1, fanout)
+    n_dirs = max(1, (n_files + per_dir - 1) // per_dir)
+    first_dir = None
+    sample_file = None
+    created = 0
+    for d in range(n_dirs):
+        dir_path = os.path.join(root, f"pkg{d // fanout:04d}", f"mod{d % fanout:04d}")
+        os.makedirs(dir_path, exist_ok=True)
+        first_dir = first_dir or dir_path
+        for i in range(min(per_dir, n_files - created)):
+            ext = ".py" if i % 5 == 0 else ".txt"
+            file_path = os.path.join(dir_path, f"file{i:04d}{ext}")
+            with open(file_path, "w", encoding="utf-8") as f:
+                f.write(f"# fixture {d}/{i}\n" * 20)
+            sample_file = sample_file or file_path
+            created += 1
+    info = {"root": root, "big_dir": first_dir, "sample_file": sample_file, "files": created, "fanout": fanout}
+    with open(marker, "w", encoding="utf-8") as f:
+        json.dump(info, f)
+    return info
+
+
+def bench_agent_loop(iterations: int, repeat: int) -> dict:
+    """测量 ReActAgent.run 的单次迭代开销（脚本化 LLM，无网络）"""
+    from agent import ReActAgent
+
+    client = ScriptedClient(loop_script(iterations))
+
+    def run_once():
+        agent = ReActAgent(api_key="bench", verbose=False, max_iterations=iterations + 1)
+        agent.client = client
+        agent.run("bench")
+
+    stats = measure(run_once, repeat)
+    # 换算为每次迭代的开销（含一次最终回答的调用）
+    per_iteration = {
+        k: (v / (iterations + 1) if k != "n" else v)
+        for k, v in stats.items()
+    }
+    return per_iteration
+
+
+def bench_tools(fixture: dict, repeat: int) -> dict:
+    """内置工具的微基准"""
+    root = fixture["root"]
+    return {
+        "search_files": measure(lambda: search_files_tool("*.py", root), repeat),
+        "list_dir": measure(lambda: list_dir_tool(fixture["big_dir"]), repeat),
+        "read_file": measure(lambda: read_file_tool(fixture["sample_file"]), repeat),
+        "bash": measure(lambda: bash_tool("true"), repeat),
+        "calculator": measure(lambda: calculator_tool("(15 + 27) * 3 - 18 / 2"), repeat),
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float, metric: str = "p50") -> list[str]:
+    """
+    与基线对比
+
+    Returns:
+        回退项描述列表，为空表示没有回退
+    """
+    regressions = []
+    for name, stats in current["benchmarks"].items():
+        base = baseline.get("benchmarks", {}).get(name)
+        if not base or not base.get(metric):
+            continue
+        ratio = stats[metric] / base[metric]
+        if ratio > 1 + tolerance:
+            regressions.append(
+                f"{name}: {metric} {stats[metric] * 1000:.3f}ms vs 基线 {base[metric] * 1000:.3f}ms (+{(ratio - 1) * 100:.1f}%)"
+            )
+    return regressions
+
+
+def run_benchmarks(
+    n_files: int = 10000,
+    repeat: int = 20,
+    iterations: int = 10,
+    fixture_dir: Optional[str] = None,
+    skip_agent: bool = False
+) -> dict:
+    """
+    运行全部基准
+
+    Args:
+        n_files: fixture 目录树中的文件数
+        repeat: 每项基准的重复次数
+        iterations: Agent 循环基准中每次运行的迭代数
+        fixture_dir: 复用已有的 fixture 目录（不存在则生成），默认使用临时目录并在结束后删除
+        skip_agent: 跳过 Agent 循环基准
+
+    Returns:
+        JSON 可序列化的结果
+    """
+    cleanup = fixture_dir is None
+    root = fixture_dir or tempfile.mkdtemp(prefix="react_bench_")
+    try:
+        start = time.perf_counter()
+        fixture = make_fixture_tree(root, n_files)
+        setup_time = time.perf_counter() - start
+
+        benchmarks = {}
+        if not skip_agent:
+            benchmarks["agent_loop_per_iteration"] = bench_agent_loop(iterations, repeat)
+        benchmarks.update(bench_tools(fixture, repeat))
+    finally:
+        if cleanup:
+            shutil.rmtree(root, ignore_errors=True)
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "files": fixture["files"],
+            "repeat": repeat,
+            "iterations": iterations,
+            "fixture_setup_seconds": setup_time,
+            "unit": "seconds",
+        },
+        "benchmarks": benchmarks,
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="bench", description="ReAct Agent 基准测试")
+    parser.add_argument("--files", type=int, default=10000, help="fixture 目录树中的文件数 (10k-1M)")
+    parser.add_argument("--repeat", type=int, default=20, help="每项基准的重复次数")
+    parser.add_argument("--iterations", type=int, default=10, help="Agent 循环基准的迭代数")
+    parser.add_argument("--fixture-dir", help="复用的 fixture 目录，生成大目录树时可避免重复创建")
+    parser.add_argument("--skip-agent", action="store_true", help="跳过 Agent 循环基准")
+    parser.add_argument("--output", help="结果输出文件，默认输出到 stdout")
+    parser.add_argument("--baseline", help="基线结果文件，出现回退时返回退出码 1")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的回退比例，默认 0.2 (20%%)")
+    parser.add_argument("--metric", default="p50", choices=["p50", "p95", "p99", "mean"], help="对比使用的指标")
+    args = parser.parse_args(argv)
+
+    result = run_benchmarks(
+        n_files=args.files,
+        repeat=args.repeat,
+        iterations=args.iterations,
+        fixture_dir=args.fixture_dir,
+        skip_agent=args.skip_agent
+    )
+
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.tolerance, args.metric)
+        if regressions:
+            print("[性能回退]", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            return 1
+        print("[无性能回退]", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,360 @@
+"""
+安全计算器模块 - 将数学表达式解析为 AST 并编译为闭包求值，不使用 eval
+只允许白名单中的语法节点、math 模块的函数和常量；乘方、移位、阶乘等运算在执行前
+估算结果大小，超过整数位数上限直接报错，求值过程另有步数和时间预算。
+编译结果按表达式缓存，重复计算同一表达式时不再解析。
+"""
+import ast
+import math
+import operator
+import time
+from functools import lru_cache
+from typing import Any, Callable
+
+# 表达式最大长度（字符）
+MAX_EXPRESSION_CHARS = 2000
+# 整数结果的最大位数（约 3000 位十进制数字，低于 str(int) 的默认上限）
+MAX_INT_BITS = 10000
+# 单次求值的最大步数（求值的节点数）与时间预算（秒）
+MAX_STEPS = 10000
+TIME_BUDGET = 1.0
+# 已编译表达式的缓存条目数
+COMPILE_CACHE_SIZE = 1024
+
+
+class CalculatorError(ValueError):
+    """表达式不合法或超出资源限制"""
+
+
+class _Budget:
+    """单次求值的步数与时间预算"""
+
+    __slots__ = ("steps", "deadline")
+
+    def __init__(self):
+        self.steps = MAX_STEPS
+        self.deadline = time.monotonic() + TIME_BUDGET
+
+    def tick(self):
+        self.steps -= 1
+        if self.steps < 0:
+            raise CalculatorError(f"计算步数超过上限 {MAX_STEPS}")
+        if time.monotonic() > self.deadline:
+            raise CalculatorError(f"计算时间超过 {TIME_BUDGET} 秒")
+
+
+Evaluator = Callable[[_Budget], Any]
+
+
+def _check_int(value: Any) -> Any:
+    """检查整数结果的位数"""
+    if isinstance(value, int) and value.bit_length() > MAX_INT_BITS:
+        raise CalculatorError(f"整数结果超过 {MAX_INT_BITS} 位")
+    return value
+
+
+def _checked_pow(base: Any, exponent: Any, modulus: Any = None) -> Any:
+    """乘方：整数乘方在计算前按 exponent * bit_length(base) 估算结果位数"""
+    if modulus is not None:
+        # 模幂的中间结果不超过模数，只需限制三个参数本身
+        return _check_int(pow(_check_int(base), _check_int(exponent), _check_int(modulus)))
+    if isinstance(base, int) and isinstance(exponent, int) and exponent > 0 and abs(base) > 1:
+        if exponent * (abs(base).bit_length() - 1) > MAX_INT_BITS:
+            raise CalculatorError(f"乘方结果超过 {MAX_INT_BITS} 位")
+    return pow(base, exponent)
+
+
+def _checked_mul(left: Any, right: Any) -> Any:
+    if isinstance(left, int) and isinstance(right, int):
+        if left.bit_length() + right.bit_length() > MAX_INT_BITS + 1:
+            raise CalculatorError(f"乘法结果超过 {MAX_INT_BITS} 位")
+    return left * right
+
+
+def _checked_lshift(left: Any, right: Any) -> Any:
+    if isinstance(left, int) and isinstance(right, int) and right > 0 and left and left.bit_length() + right > MAX_INT_BITS:
+        raise CalculatorError(f"移位结果超过 {MAX_INT_BITS} 位")
+    return left << right
+
+
+# n 不超过该值时 lgamma 之差足够精确；更大的 n 只按整数上界检查
+_LGAMMA_EXACT_LIMIT = 2 ** 40
+
+
+def _log2_factorial(n: float) -> float:
+    """log2(n!)，用于在计算前估算阶乘、组合数的位数"""
+    return math.lgamma(n + 1) / math.log(2) if n > 1 else 0.0
+
+
+def _checked_factorial(n: Any) -> int:
+    if isinstance(n, int) and _log2_factorial(n) > MAX_INT_BITS:
+        raise CalculatorError(f"阶乘结果超过 {MAX_INT_BITS} 位")
+    return math.factorial(n)
+
+
+def _checked_perm(n: Any, k: Any = None) -> int:
+    if isinstance(n, int) and n > 0:
+        k_value = n if k is None else k
+        if isinstance(k_value, int) and 0 <= k_value <= n:
+            # 结果不超过 n ** k，整数上界在范围内时无需估算
+            if k_value * n.bit_length() > MAX_INT_BITS and (
+                n > _LGAMMA_EXACT_LIMIT or _log2_factorial(n) - _log2_factorial(n - k_value) > MAX_INT_BITS
+            ):
+                raise CalculatorError(f"排列数超过 {MAX_INT_BITS} 位")
+    return math.perm(n, k)
+
+
+def _checked_comb(n: Any, k: Any) -> int:
+    if isinstance(n, int) and isinstance(k, int) and 0 <= k <= n:
+        # 结果不超过 n ** min(k, n - k)，整数上界在范围内时无需估算
+        if min(k, n - k) * n.bit_length() > MAX_INT_BITS and (
+            n > _LGAMMA_EXACT_LIMIT
+            or _log2_factorial(n) - _log2_factorial(k) - _log2_factorial(n - k) > MAX_INT_BITS
+        ):
+            raise CalculatorError(f"组合数超过 {MAX_INT_BITS} 位")
+    return math.comb(n, k)
+
+
+def _int_bits(values: Any) -> int:
+    """整数参数的位数之和，是乘积、最小公倍数位数的上界"""
+    return sum(value.bit_length() for value in values if isinstance(value, int))
+
+
+def _checked_prod(iterable: Any, start: Any = 1) -> Any:
+    values = list(iterable)
+    if _int_bits(values) + _int_bits([start]) > MAX_INT_BITS:
+        raise CalculatorError(f"乘积结果超过 {MAX_INT_BITS} 位")
+    return math.prod(values, start=start)
+
+
+def _checked_lcm(*integers: Any) -> int:
+    if _int_bits(integers) > MAX_INT_BITS:
+        raise CalculatorError(f"最小公倍数超过 {MAX_INT_BITS} 位")
+    return math.lcm(*integers)
+
+
+def _checked_round(number: Any, ndigits: Any = None) -> Any:
+    # 整数按负的 ndigits 取整时需要计算 10 ** -ndigits
+    if isinstance(ndigits, int) and abs(ndigits) > MAX_INT_BITS:
+        raise CalculatorError(f"round 的位数超过 {MAX_INT_BITS}")
+    return round(number, ndigits)
+
+
+# math 模块的公开函数和常量，结果可能极大的整数函数替换为带检查的版本
+# （pow、ldexp、exp 等返回浮点数，溢出时抛出 OverflowError，无需额外检查）
+MATH_ATTRIBUTES: dict[str, Any] = {name: getattr(math, name) for name in dir(math) if not name.startswith("_")}
+MATH_ATTRIBUTES.update({
+    "factorial": _checked_factorial,
+    "perm": _checked_perm,
+    "comb": _checked_comb,
+    "prod": _checked_prod,
+    "lcm": _checked_lcm,
+})
+# 表达式中可直接使用的名称：math 模块的内容加上常用内置函数（pow 为内置的整数乘方）
+NAMES: dict[str, Any] = dict(MATH_ATTRIBUTES)
+NAMES.update({
+    "abs": abs,
+    "round": _checked_round,
+    "min": min,
+    "max": max,
+    "sum": sum,
+    "int": int,
+    "float": float,
+    "divmod": divmod,
+    "pow": _checked_pow,
+})
+
+_BINARY_OPERATORS: dict[type, Callable[[Any, Any], Any]] = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: _checked_mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: _checked_pow,
+    ast.LShift: _checked_lshift,
+    ast.RShift: operator.rshift,
+    ast.BitOr: operator.or_,
+    ast.BitXor: operator.xor,
+    ast.BitAnd: operator.and_,
+}
+_UNARY_OPERATORS: dict[type, Callable[[Any], Any]] = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+    ast.Invert: operator.invert,
+    ast.Not: operator.not_,
+}
+_COMPARE_OPERATORS: dict[type, Callable[[Any, Any], bool]] = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float, complex))
+
+
+def _numeric(value: Any) -> Any:
+    """运算符只接受数字，避免 [1] * 10**9 之类的序列运算"""
+    if not _is_number(value):
+        raise CalculatorError(f"运算对象必须是数字，而不是 {type(value).__name__}")
+    return value
+
+
+def _compile_node(node: ast.AST) -> Evaluator:
+    """把白名单内的 AST 节点编译为求值闭包，遇到其他节点抛出 CalculatorError"""
+    if isinstance(node, ast.Constant):
+        value = node.value
+        if not _is_number(value):
+            raise CalculatorError(f"不支持的常量: {value!r}")
+        _check_int(value)
+        return lambda budget: value
+
+    if isinstance(node, ast.Name):
+        if node.id not in NAMES:
+            raise CalculatorError(f"未知的名称: {node.id}")
+        value = NAMES[node.id]
+        return lambda budget: value
+
+    if isinstance(node, ast.Attribute):
+        if not (isinstance(node.value, ast.Name) and node.value.id == "math" and node.attr in MATH_ATTRIBUTES):
+            raise CalculatorError(f"不支持的属性: {ast.unparse(node)}")
+        value = MATH_ATTRIBUTES[node.attr]
+        return lambda budget: value
+
+    if isinstance(node, ast.BinOp):
+        op = _BINARY_OPERATORS.get(type(node.op))
+        if op is None:
+            raise CalculatorError(f"不支持的运算符: {type(node.op).__name__}")
+        left, right = _compile_node(node.left), _compile_node(node.right)
+
+        def binary(budget: _Budget) -> Any:
+            budget.tick()
+            return _check_int(op(_numeric(left(budget)), _numeric(right(budget))))
+        return binary
+
+    if isinstance(node, ast.UnaryOp):
+        op = _UNARY_OPERATORS.get(type(node.op))
+        if op is None:
+            raise CalculatorError(f"不支持的运算符: {type(node.op).__name__}")
+        operand = _compile_node(node.operand)
+
+        def unary(budget: _Budget) -> Any:
+            budget.tick()
+            return op(_numeric(operand(budget)))
+        return unary
+
+    if isinstance(node, ast.Compare):
+        ops = []
+        for op_node in node.ops:
+            op = _COMPARE_OPERATORS.get(type(op_node))
+            if op is None:
+                raise CalculatorError(f"不支持的比较运算符: {type(op_node).__name__}")
+            ops.append(op)
+        left = _compile_node(node.left)
+        comparators = [_compile_node(c) for c in node.comparators]
+
+        def compare(budget: _Budget) -> bool:
+            budget.tick()
+            current = _numeric(left(budget))
+            for op, comparator in zip(ops, comparators):
+                value = _numeric(comparator(budget))
+                if not op(current, value):
+                    return False
+                current = value
+            return True
+        return compare
+
+    if isinstance(node, ast.BoolOp):
+        values = [_compile_node(v) for v in node.values]
+        is_and = isinstance(node.op, ast.And)
+
+        def bool_op(budget: _Budget) -> Any:
+            budget.tick()
+            result = None
+            for value in values:
+                result = value(budget)
+                if bool(result) != is_and:
+                    return result
+            return result
+        return bool_op
+
+    if isinstance(node, ast.IfExp):
+        test, body, orelse = _compile_node(node.test), _compile_node(node.body), _compile_node(node.orelse)
+
+        def if_exp(budget: _Budget) -> Any:
+            budget.tick()
+            return body(budget) if test(budget) else orelse(budget)
+        return if_exp
+
+    if isinstance(node, (ast.Tuple, ast.List)):
+        # 只用作 min/max/sum 等函数的参数
+        items = [_compile_node(e) for e in node.elts]
+        container = tuple if isinstance(node, ast.Tuple) else list
+
+        def sequence(budget: _Budget) -> Any:
+            budget.tick()
+            return container(item(budget) for item in items)
+        return sequence
+
+    if isinstance(node, ast.Call):
+        if node.keywords:
+            raise CalculatorError("不支持关键字参数")
+        func = _compile_node(node.func)
+        args = [_compile_node(a) for a in node.args]
+
+        def call(budget: _Budget) -> Any:
+            budget.tick()
+            function = func(budget)
+            if not callable(function):
+                raise CalculatorError(f"{ast.unparse(node.func)} 不是函数")
+            return _check_int(function(*[arg(budget) for arg in args]))
+        return call
+
+    raise CalculatorError(f"不支持的语法: {type(node).__name__}")
+
+
+@lru_cache(maxsize=COMPILE_CACHE_SIZE)
+def compile_expression(expression: str) -> Evaluator:
+    """
+    解析并编译表达式（结果按表达式缓存）
+
+    Raises:
+        CalculatorError: 表达式过长、语法错误或含有不允许的节点
+    """
+    if len(expression) > MAX_EXPRESSION_CHARS:
+        raise CalculatorError(f"表达式超过 {MAX_EXPRESSION_CHARS} 个字符")
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except (SyntaxError, ValueError) as e:
+        raise CalculatorError(f"语法错误: {e.msg if isinstance(e, SyntaxError) else e}") from None
+    except (RecursionError, MemoryError):
+        raise CalculatorError("表达式嵌套过深") from None
+    try:
+        return _compile_node(tree.body)
+    except RecursionError:
+        raise CalculatorError("表达式嵌套过深") from None
+
+
+def evaluate(expression: str) -> Any:
+    """
+    安全地计算数学表达式
+
+    Args:
+        expression: 数学表达式，如 "2 + 3 * 4"、"sqrt(2) * pi"、"math.log(100, 10)"
+
+    Returns:
+        计算结果
+
+    Raises:
+        CalculatorError: 表达式不合法或超出资源限制
+        ArithmeticError: 除零、溢出等运算错误
+    """
+    try:
+        return compile_expression(expression)(_Budget())
+    except RecursionError:
+        raise CalculatorError("表达式嵌套过深") from None
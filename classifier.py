@@ -0,0 +1,223 @@
+"""
+本地意图分类模块 - 为 MultiAgentRouter 提供无需 LLM 的快速分类
+关键词/正则规则 + 字符 n-gram 朴素贝叶斯，置信度不足时交由 LLM 分类
+"""
+import json
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Iterable, Optional
+
+LABELS = ("explore", "code", "bash", "general")
+
+# 默认规则：每个类型的关键词/正则，命中越多置信度越高
+DEFAULT_RULES: dict[str, list[str]] = {
+    "explore": [
+        r"搜索", r"查找", r"找到", r"找出", r"列出", r"在哪", r"哪些文件", r"目录结构", r"代码结构",
+        r"理解.*代码", r"阅读", r"查看.*(文件|代码)", r"\b(find|search|grep|where is|list files)\b",
+    ],
+    "code": [
+        r"编写", r"写一个", r"实现", r"创建.*(文件|函数|类|模块)", r"修改.*代码", r"重构", r"修复.*bug",
+        r"添加.*(功能|函数|方法)", r"函数", r"\b(implement|refactor|write a|create a (function|class|file))\b",
+    ],
+    "bash": [
+        r"执行", r"运行", r"安装", r"命令", r"终端", r"\bshell\b",
+        r"\b(pip|npm|yarn|git|echo|ls|cd|mkdir|rm|make|docker|curl|chmod)\b",
+    ],
+    "general": [
+        r"你好", r"您好", r"什么是", r"解释", r"为什么", r"介绍", r"计算", r"\b(hello|hi|what is|explain|why)\b",
+    ],
+}
+
+
+class RuleClassifier:
+    """基于关键词/正则规则的分类器"""
+
+    def __init__(self, rules: Optional[dict[str, list[str]]] = None):
+        rules = rules or DEFAULT_RULES
+        self.patterns = {
+            label: [re.compile(p, re.IGNORECASE) for p in patterns]
+            for label, patterns in rules.items()
+        }
+
+    def classify(self, text: str) -> tuple[Optional[str], float]:
+        """
+        分类文本
+
+        Returns:
+            (类型, 置信度)；没有规则命中时类型为 None。
+            置信度 = 最高分 / (最高分 + 次高分 + 0.5)，多个类型同时命中时置信度较低。
+        """
+        scores = {
+            label: sum(1 for p in patterns if p.search(text))
+            for label, patterns in self.patterns.items()
+        }
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        top_label, top = ranked[0]
+        if top == 0:
+            return None, 0.0
+        second = ranked[1][1] if len(ranked) > 1 else 0
+        return top_label, top / (top + second + 0.5)
+
+
+class NaiveBayesClassifier:
+    """字符 n-gram 多项式朴素贝叶斯，适合中英文混合的短文本"""
+
+    def __init__(self, ngram_range: tuple[int, int] = (1, 3), alpha: float = 1.0):
+        self.ngram_range = ngram_range
+        self.alpha = alpha
+        self.class_counts: Counter = Counter()
+        self.feature_counts: dict[str, Counter] = defaultdict(Counter)
+        self.total_features: Counter = Counter()
+        self.vocabulary: set[str] = set()
+
+    def _features(self, text: str) -> list[str]:
+        text = re.sub(r"\s+", " ", text.lower().strip())
+        low, high = self.ngram_range
+        return [
+            text[i:i + n]
+            for n in range(low, high + 1)
+            for i in range(len(text) - n + 1)
+        ]
+
+    @property
+    def trained(self) -> bool:
+        return bool(self.class_counts)
+
+    def fit(self, samples: Iterable[tuple[str, str]]) -> "NaiveBayesClassifier":
+        """
+        增量训练
+
+        Args:
+            samples: (文本, 类型) 序列
+        """
+        for text, label in samples:
+            self.class_counts[label] += 1
+            for feature in self._features(text):
+                self.feature_counts[label][feature] += 1
+                self.total_features[label] += 1
+                self.vocabulary.add(feature)
+        return self
+
+    def predict_proba(self, text: str) -> dict[str, float]:
+        """返回各类型的后验概率"""
+        if not self.trained:
+            return {}
+        features = self._features(text)
+        n_samples = sum(self.class_counts.values())
+        vocab_size = len(self.vocabulary)
+        log_probs = {}
+        for label, count in self.class_counts.items():
+            log_prob = math.log(count / n_samples)
+            denominator = self.total_features[label] + self.alpha * vocab_size
+            counts = self.feature_counts[label]
+            for feature in features:
+                log_prob += math.log((counts[feature] + self.alpha) / denominator)
+            log_probs[label] = log_prob
+        # softmax
+        peak = max(log_probs.values())
+        exp = {label: math.exp(lp - peak) for label, lp in log_probs.items()}
+        total = sum(exp.values())
+        return {label: v / total for label, v in exp.items()}
+
+    def classify(self, text: str) -> tuple[Optional[str], float]:
+        """返回 (类型, 后验概率)，未训练时类型为 None"""
+        proba = self.predict_proba(text)
+        if not proba:
+            return None, 0.0
+        label = max(proba, key=proba.get)
+        return label, proba[label]
+
+    def to_dict(self) -> dict:
+        return {
+            "ngram_range": list(self.ngram_range),
+            "alpha": self.alpha,
+            "class_counts": dict(self.class_counts),
+            "feature_counts": {label: dict(c) for label, c in self.feature_counts.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "NaiveBayesClassifier":
+        model = cls(tuple(data["ngram_range"]), data["alpha"])
+        model.class_counts = Counter(data["class_counts"])
+        for label, counts in data["feature_counts"].items():
+            model.feature_counts[label] = Counter(counts)
+            model.total_features[label] = sum(counts.values())
+            model.vocabulary.update(counts)
+        return model
+
+
+class IntentClassifier:
+    """
+    本地意图分类器
+
+    先走规则，再走朴素贝叶斯，任一路径置信度达到阈值即返回；
+    都不够确定时返回 None，由调用方回退到 LLM 分类。
+    """
+
+    def __init__(
+        self,
+        rules: Optional[dict[str, list[str]]] = None,
+        model: Optional[NaiveBayesClassifier] = None,
+        rule_threshold: float = 0.6,
+        model_threshold: float = 0.8
+    ):
+        """
+        初始化分类器
+
+        Args:
+            rules: 规则表，默认使用 DEFAULT_RULES
+            model: 已训练的朴素贝叶斯模型，默认为空（仅规则）
+            rule_threshold: 规则路径的置信度阈值
+            model_threshold: 模型路径的置信度阈值
+        """
+        self.rules = RuleClassifier(rules)
+        self.model = model or NaiveBayesClassifier()
+        self.rule_threshold = rule_threshold
+        self.model_threshold = model_threshold
+
+    def classify(self, text: str) -> Optional[tuple[str, float, str]]:
+        """
+        本地分类
+
+        Returns:
+            (类型, 置信度, 来源 rule/model)，置信度不足时返回 None
+        """
+        label, confidence = self.rules.classify(text)
+        if label and confidence >= self.rule_threshold:
+            return label, confidence, "rule"
+        label, confidence = self.model.classify(text)
+        if label and confidence >= self.model_threshold:
+            return label, confidence, "model"
+        return None
+
+    def fit_from_log(self, path: str) -> int:
+        """
+        从分类决策日志训练模型
+
+        日志为 JSONL，每行包含 input 和 label（MultiAgentRouter 的 decision_log 格式）。
+
+        Returns:
+            训练样本数
+        """
+        samples = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                if record.get("label") in LABELS:
+                    samples.append((record["input"], record["label"]))
+        self.model.fit(samples)
+        return len(samples)
+
+    def save_model(self, path: str):
+        """保存朴素贝叶斯模型"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.model.to_dict(), f, ensure_ascii=False)
+
+    def load_model(self, path: str):
+        """加载朴素贝叶斯模型"""
+        with open(path, "r", encoding="utf-8") as f:
+            self.model = NaiveBayesClassifier.from_dict(json.load(f))
@@ -0,0 +1,190 @@
+"""
+上下文管理模块 - 按 token 预算压缩对话历史
+长对话中每轮的用户消息、助手消息和工具结果都会累积，这里在每次调用 LLM 前
+将历史压缩到预算以内
+"""
+import re
+from typing import Callable, Optional
+
+# 摘要消息的前缀，用于识别并合并已有摘要
+SUMMARY_PREFIX = "[早前对话摘要]"
+# 已截断的工具输出末尾的标记，再次压缩时不重复截断
+_TRUNCATED_MARKER = re.compile(r"\n\[已省略旧工具输出 \d+ 字符\]\Z")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的 token 数
+
+    ASCII 字符约 4 个一个 token，中文等非 ASCII 字符约 1 个一个 token。
+    """
+    if not text:
+        return 0
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return non_ascii + (len(text) - non_ascii + 3) // 4
+
+
+def estimate_message_tokens(message: dict) -> int:
+    """估算单条消息的 token 数（含角色等固定开销）"""
+    tokens = 4 + estimate_tokens(message.get("content") or "")
+    for tc in message.get("tool_calls") or []:
+        function = tc.get("function", {})
+        tokens += 4 + estimate_tokens(function.get("name", "")) + estimate_tokens(function.get("arguments", ""))
+    return tokens
+
+
+def estimate_messages_tokens(messages: list[dict]) -> int:
+    """估算消息列表的 token 数"""
+    return sum(estimate_message_tokens(m) for m in messages)
+
+
+class ContextManager:
+    """
+    按 token 预算压缩对话历史
+
+    超出预算时按以下顺序压缩，直到降到 max_tokens * target_ratio 以下：
+    1. 截断旧的工具输出（最近 keep_tool_results 条保持原样）
+    2. 从最早的轮次开始整轮丢弃（一轮 = 一条用户消息及其后的助手/工具消息），
+       提供 summarizer 时将被丢弃的内容汇总为一条摘要消息，
+       以 user 角色放在系统提示之后（部分服务端不接受对话中间的 system 消息）
+
+    系统提示和最近 keep_recent_turns 轮始终保留。
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 32000,
+        keep_recent_turns: int = 4,
+        keep_tool_results: int = 6,
+        tool_output_chars: int = 200,
+        target_ratio: float = 0.75,
+        summarizer: Optional[Callable[[list[dict]], str]] = None
+    ):
+        """
+        初始化上下文管理器
+
+        Args:
+            max_tokens: 触发压缩的 token 预算
+            keep_recent_turns: 始终保留的最近轮数
+            keep_tool_results: 不截断的最近工具结果条数
+            tool_output_chars: 截断后保留的工具输出字符数
+            target_ratio: 压缩目标占预算的比例，留出余量避免每轮都触发压缩
+            summarizer: 可选的摘要函数，接收被丢弃的消息，返回摘要文本
+        """
+        self.max_tokens = max_tokens
+        self.keep_recent_turns = keep_recent_turns
+        self.keep_tool_results = keep_tool_results
+        self.tool_output_chars = tool_output_chars
+        self.target_ratio = target_ratio
+        self.summarizer = summarizer
+
+    def compact(self, messages: list[dict]) -> list[dict]:
+        """
+        压缩消息列表，未超出预算时原样返回
+
+        Args:
+            messages: 当前对话历史
+
+        Returns:
+            压缩后的对话历史（新列表，不修改原消息）
+        """
+        if estimate_messages_tokens(messages) <= self.max_tokens:
+            return messages
+        target = int(self.max_tokens * self.target_ratio)
+
+        messages = self._truncate_tool_outputs(messages)
+        if estimate_messages_tokens(messages) <= target:
+            return messages
+
+        return self._evict_turns(messages, target)
+
+    def _truncate_tool_outputs(self, messages: list[dict]) -> list[dict]:
+        """截断除最近若干条以外的工具输出"""
+        tool_indexes = [i for i, m in enumerate(messages) if m.get("role") == "tool"]
+        stale = set(tool_indexes[:max(0, len(tool_indexes) - self.keep_tool_results)])
+
+        result = []
+        for i, message in enumerate(messages):
+            content = message.get("content") or ""
+            # 已截断过的输出保持原样，省略字数仍是原始输出的，且不改变已发送过的前缀
+            if i in stale and len(content) > self.tool_output_chars and not _TRUNCATED_MARKER.search(content):
+                omitted = len(content) - self.tool_output_chars
+                message = {
+                    **message,
+                    "content": f"{content[:self.tool_output_chars]}\n[已省略旧工具输出 {omitted} 字符]"
+                }
+            result.append(message)
+        return result
+
+    def _evict_turns(self, messages: list[dict], target: int) -> list[dict]:
+        """从最早的轮次开始整轮丢弃"""
+        head: list[dict] = []
+        rest = messages
+        if rest and rest[0].get("role") == "system":
+            head, rest = [rest[0]], rest[1:]
+
+        # 已有的摘要消息与新丢弃的内容合并
+        summary: Optional[dict] = None
+        if rest and rest[0].get("role") == "user" and (rest[0].get("content") or "").startswith(SUMMARY_PREFIX):
+            summary, rest = rest[0], rest[1:]
+
+        turns = self._split_turns(rest)
+        evictable = max(0, len(turns) - self.keep_recent_turns)
+        evicted: list[dict] = []
+
+        def current_tokens() -> int:
+            pending_summary = [summary] if summary else []
+            return estimate_messages_tokens(head + pending_summary + [m for t in turns for m in t])
+
+        while evictable > 0 and current_tokens() > target:
+            evicted.extend(turns.pop(0))
+            evictable -= 1
+
+        if evicted and self.summarizer:
+            to_summarize = ([summary] if summary else []) + evicted
+            summary = {
+                "role": "user",
+                "content": f"{SUMMARY_PREFIX}\n{self.summarizer(to_summarize)}"
+            }
+
+        return head + ([summary] if summary else []) + [m for t in turns for m in t]
+
+    @staticmethod
+    def _split_turns(messages: list[dict]) -> list[list[dict]]:
+        """按用户消息切分轮次，保证工具调用与工具结果不会被拆开"""
+        turns: list[list[dict]] = []
+        for message in messages:
+            if message.get("role") == "user" or not turns:
+                turns.append([message])
+            else:
+                turns[-1].append(message)
+        return turns
+
+
+def make_llm_summarizer(client, model: str, max_tokens: int = 500) -> Callable[[list[dict]], str]:
+    """
+    创建基于 LLM 的摘要函数
+
+    Args:
+        client: 同步 OpenAI 客户端
+        model: 用于摘要的模型
+        max_tokens: 摘要最大长度
+
+    Returns:
+        可传给 ContextManager(summarizer=...) 的函数
+    """
+    def summarize(messages: list[dict]) -> str:
+        transcript = "\n".join(
+            f"{m.get('role')}: {m.get('content') or ''}"
+            for m in messages
+        )
+        response = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": "将以下对话压缩为简洁的要点摘要，保留关键事实、文件路径和结论。"},
+                {"role": "user", "content": transcript}
+            ],
+            max_tokens=max_tokens
+        )
+        return response.choices[0].message.content or ""
+    return summarize
@@ -0,0 +1,104 @@
+"""
+文件内容缓存模块 - 进程内按字节数限制的 LRU 缓存
+以 (路径, inode, mtime_ns, 大小) 校验条目，文件被修改或替换后自动失效，
+命中时只需一次 stat，适合网络挂载的工作区中反复读取同一批文件
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+def file_key(path: str, stat: os.stat_result) -> tuple:
+    """文件标识：(绝对路径, inode, mtime_ns, 大小)"""
+    return (os.path.abspath(path), stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class FileContentCache:
+    """
+    文件内容缓存
+
+    - 每次读取先 stat，标识与缓存条目一致才返回缓存内容
+    - 总大小超过 max_bytes 时淘汰最久未使用的条目
+    - 超过 max_entry_bytes 的文件不缓存
+    - 进程内的写入应调用 invalidate()；同一 mtime 精度内大小不变的外部修改无法察觉
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entry_bytes: int = 4 * 1024 * 1024):
+        """
+        初始化文件内容缓存
+
+        Args:
+            max_bytes: 缓存总大小上限（字节）
+            max_entry_bytes: 单个文件的大小上限（字节）
+        """
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[tuple, bytes]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def read(self, path: str, stat: Optional[os.stat_result] = None) -> tuple[bytes, tuple]:
+        """
+        读取文件内容
+
+        Args:
+            path: 文件路径
+            stat: 调用方已获取的 os.stat 结果，省去一次 stat
+
+        Returns:
+            (文件内容, 文件标识)
+
+        Raises:
+            OSError: 文件不存在或无法读取
+        """
+        key = file_key(path, stat or os.stat(path))
+        with self._lock:
+            entry = self._entries.get(key[0])
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(key[0])
+                self.hits += 1
+                return entry[1], key
+            self.misses += 1
+
+        with open(path, "rb") as f:
+            data = f.read()
+            # 以实际读到内容时的标识为准，避免 stat 与读取之间文件被修改
+            stat = os.fstat(f.fileno())
+            key = (key[0], stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if len(data) == key[3]:
+            self._put(key, data)
+        return data, key
+
+    def _put(self, key: tuple, data: bytes):
+        if len(data) > self.max_entry_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key[0], None)
+            if old is not None:
+                self._size -= len(old[1])
+            self._entries[key[0]] = (key, data)
+            self._size += len(data)
+            while self._size > self.max_bytes and self._entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def invalidate(self, path: str):
+        """删除某个文件的缓存条目"""
+        with self._lock:
+            entry = self._entries.pop(os.path.abspath(path), None)
+            if entry is not None:
+                self._size -= len(entry[1])
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    @property
+    def size(self) -> int:
+        """当前缓存的总字节数"""
+        return self._size
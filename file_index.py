@@ -0,0 +1,317 @@
+"""
+文件索引模块 - 为 search_files 提供增量更新的文件路径索引
+每个根目录一个索引：首次构建时遍历目录树，之后只 stat 各目录，mtime 未变的目录复用上次的列表；
+索引可持久化到 SQLite，进程重启后同样只需增量刷新。查询在内存中用正则完成。
+"""
+import bisect
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Iterator, Optional
+
+from ignore_rules import IgnoreMatcher, IgnoreRules
+
+# 持久化索引的表结构版本，变化时丢弃旧索引
+_SCHEMA_VERSION = 2
+
+
+def glob_to_regex(pattern: str, full_path: bool = False) -> str:
+    """
+    将通配符模式转换为匹配单行相对路径的正则（不含锚点）
+
+    - 文件名模式中 * 和 ? 不匹配路径分隔符
+    - full_path 为 True 时 ** 匹配任意层级目录
+    """
+    i, n = 0, len(pattern)
+    parts = []
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if full_path and pattern.startswith("**", i):
+                i += 2
+                if i < n and pattern[i] == "/":
+                    # "**/" 匹配零个或多个目录
+                    parts.append("(?:[^\\n]*/)?")
+                    i += 1
+                else:
+                    parts.append("[^\\n]*")
+                continue
+            parts.append("[^/\\n]*")
+        elif c == "?":
+            parts.append("[^/\\n]")
+        elif c == "[":
+            j = pattern.find("]", i + 2 if i + 1 < n and pattern[i + 1] in "!^" else i + 1)
+            if j == -1:
+                parts.append("\\[")
+            else:
+                body = pattern[i + 1:j]
+                if body[:1] in ("!", "^"):
+                    body = "^" + body[1:]
+                parts.append("[" + body.replace("\\", "\\\\") + "]")
+                i = j
+        else:
+            parts.append(re.escape(c))
+        i += 1
+    return "".join(parts)
+
+
+class SearchQuery:
+    """
+    文件搜索查询
+
+    - 含 / 或 ** 的模式匹配完整相对路径，** 匹配任意层级目录（如 src/**/*.py）
+    - 其他含通配符（* ? [）的模式按 fnmatch 语义匹配文件名
+    - 不含通配符的模式与文件名完全相同才匹配；空模式匹配全部文件
+    """
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.full_path = "/" in pattern or "**" in pattern
+        self.match_all = not pattern
+        if self.full_path:
+            pattern = pattern[2:] if pattern.startswith("./") else pattern.lstrip("/")
+            body = glob_to_regex(pattern, full_path=True)
+        else:
+            # 不含通配符时 glob_to_regex 只做转义，即按文件名精确匹配
+            body = glob_to_regex(pattern)
+        self.regex = re.compile(body)
+        # 在以换行分隔的文本上查找，前导 \n 让正则引擎可以快速定位行首
+        self.multiline = re.compile(f"\n(?:{body})(?=\n)")
+
+    def matches(self, name: str, rel_path: str) -> bool:
+        """判断文件是否匹配"""
+        if self.match_all:
+            return True
+        return self.regex.fullmatch(rel_path if self.full_path else name) is not None
+
+
+class FileIndex:
+    """
+    单个根目录的文件路径索引
+
+    内存中保存 相对目录 -> (mtime_ns, 文件名列表, 子目录名列表, 忽略规则标识)、按深度优先顺序
+    排列的全部相对路径，以及与之一一对应、以换行拼接的文件名文本；查询时直接在该文本上
+    运行正则查找，不逐个调用 Python 函数。目录本身或其生效的忽略规则变化时重新扫描。
+    """
+
+    def __init__(self, root: str, db_path: Optional[str] = None, ignore: Optional[IgnoreMatcher] = None, signature: str = ""):
+        """
+        初始化索引（不立即构建）
+
+        Args:
+            root: 根目录
+            db_path: SQLite 文件路径，为 None 时只保存在内存中
+            ignore: 忽略规则，被忽略的文件不加入索引、被忽略的目录不再进入
+            signature: 默认忽略模式等影响索引内容的配置摘要，与持久化的索引不一致时重建
+        """
+        self.root = os.path.abspath(root)
+        self.db_path = db_path
+        self.ignore = ignore
+        self.signature = signature
+        self.last_refresh = 0.0
+        self._dirs: dict[str, tuple[int, list[str], list[str], str]] = {}
+        # (相对路径列表, "\n" + 文件名 + "\n" + ..., 每个文件名的起始偏移)，整体替换以保证查询看到一致的快照
+        self._snapshot: Optional[tuple[list[str], str, list[int]]] = None
+        # 完整路径文本及偏移，首次按路径查询时由当前快照生成
+        self._path_text: Optional[tuple[tuple, str, list[int]]] = None
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._load()
+
+    @property
+    def paths(self) -> list[str]:
+        """全部文件的相对路径（深度优先顺序）"""
+        return self._snapshot[0] if self._snapshot else []
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def _load(self):
+        """从 SQLite 加载上次保存的索引"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        signature = f"{self.root}\0{_SCHEMA_VERSION}\0{self.signature}"
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+        stale = row is None or row[0] != signature
+        if stale:
+            # 配置或表结构变化，丢弃旧索引
+            self._conn.execute("DROP TABLE IF EXISTS dirs")
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('signature', ?)", (signature,))
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, "
+            "files TEXT NOT NULL, subdirs TEXT NOT NULL, rules TEXT NOT NULL)"
+        )
+        self._conn.commit()
+        if stale:
+            return
+        for path, mtime_ns, files, subdirs, rules in self._conn.execute("SELECT path, mtime_ns, files, subdirs, rules FROM dirs"):
+            self._dirs[path] = (mtime_ns, files.split("\0") if files else [], subdirs.split("\0") if subdirs else [], rules)
+
+    def _scan(self, rel: str, parent_rules: Optional[IgnoreRules]) -> tuple[list[str], list[str], Optional[IgnoreRules]]:
+        """扫描单个目录，返回排序后的 (文件名, 子目录名, 该目录生效的忽略规则)；不进入目录符号链接"""
+        with os.scandir(os.path.join(self.root, rel) if rel else self.root) as it:
+            entries = list(it)
+        rules = None
+        if self.ignore is not None:
+            rules = self.ignore.dir_rules(rel, {entry.name for entry in entries}, parent_rules)
+        files, subdirs = [], []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.name)
+            elif not entry.is_dir():
+                files.append(entry.name)
+        if rules is not None:
+            prefix = f"{rel}/" if rel else ""
+            files = rules.filter(prefix, files, False)
+            subdirs = rules.filter(prefix, subdirs, True)
+        files.sort()
+        subdirs.sort()
+        return files, subdirs, rules
+
+    def _cached_rules(self, rel: str, files: list[str], parent_rules: Optional[IgnoreRules]) -> Optional[IgnoreRules]:
+        """根据缓存的文件列表计算目录生效的忽略规则，只 stat 该目录中的忽略文件"""
+        if self.ignore is None:
+            return None
+        present = []
+        for name in self.ignore.ignore_files:
+            i = bisect.bisect_left(files, name)
+            if i < len(files) and files[i] == name:
+                present.append(name)
+        return self.ignore.dir_rules(rel, present, parent_rules)
+
+    def refresh(self) -> int:
+        """
+        增量刷新索引
+
+        按深度优先顺序 stat 每个目录，mtime 或生效的忽略规则变化的目录重新扫描，其余复用缓存。
+
+        Returns:
+            重新扫描的目录数
+        """
+        with self._lock:
+            new_dirs: dict[str, tuple[int, list[str], list[str], str]] = {}
+            changed = []
+            stack: list[tuple[str, Optional[IgnoreRules]]] = [("", self.ignore.root_rules() if self.ignore else None)]
+            while stack:
+                rel, parent_rules = stack.pop()
+                try:
+                    mtime_ns = os.stat(os.path.join(self.root, rel) if rel else self.root).st_mtime_ns
+                    cached = self._dirs.get(rel)
+                    rules = None
+                    if cached is not None and cached[0] == mtime_ns:
+                        rules = self._cached_rules(rel, cached[1], parent_rules)
+                        if (rules.key if rules else "") != cached[3]:
+                            cached = None
+                    if cached is not None and cached[0] == mtime_ns:
+                        files, subdirs = cached[1], cached[2]
+                    else:
+                        files, subdirs, rules = self._scan(rel, parent_rules)
+                        changed.append(rel)
+                except OSError:
+                    if not rel:
+                        raise
+                    continue
+                new_dirs[rel] = (mtime_ns, files, subdirs, rules.key if rules else "")
+                prefix = f"{rel}/" if rel else ""
+                stack.extend((prefix + d, rules) for d in reversed(subdirs))
+
+            removed = [rel for rel in self._dirs if rel not in new_dirs]
+            if changed or removed or self._snapshot is None:
+                self._dirs = new_dirs
+                self._rebuild()
+                self._persist(changed, removed)
+            self.last_refresh = time.monotonic()
+            return len(changed)
+
+    def _rebuild(self):
+        """重建路径列表和文件名文本（调用方持有锁）"""
+        paths = []
+        names = []
+        for rel, (_, files, _, _) in self._dirs.items():
+            prefix = f"{rel}/" if rel else ""
+            paths.extend(prefix + name for name in files)
+            names.extend(files)
+        text, starts = _join_lines(names)
+        self._snapshot = (paths, text, starts)
+
+    def _persist(self, changed: list[str], removed: list[str]):
+        """把变化的目录写入 SQLite（调用方持有锁）"""
+        if self._conn is None:
+            return
+        self._conn.executemany("DELETE FROM dirs WHERE path = ?", [(rel,) for rel in removed])
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO dirs (path, mtime_ns, files, subdirs, rules) VALUES (?, ?, ?, ?, ?)",
+            [
+                (rel, self._dirs[rel][0], "\0".join(self._dirs[rel][1]), "\0".join(self._dirs[rel][2]), self._dirs[rel][3])
+                for rel in changed
+            ]
+        )
+        self._conn.commit()
+
+    def _full_paths(self, snapshot: tuple) -> tuple[str, list[int]]:
+        """按需生成与快照对应的 "\n" + 相对路径 + "\n" + ... 文本及每行起始偏移"""
+        cached = self._path_text
+        if cached is not None and cached[0] is snapshot:
+            return cached[1], cached[2]
+        text, starts = _join_lines(snapshot[0])
+        self._path_text = (snapshot, text, starts)
+        return text, starts
+
+    def search(self, query: SearchQuery, max_depth: Optional[int] = None) -> Iterator[str]:
+        """
+        惰性返回匹配的相对路径（深度优先顺序），调用方停止迭代即停止查找
+
+        Args:
+            query: 搜索查询
+            max_depth: 最大目录深度，1 表示只搜索根目录下的文件
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return
+        if max_depth is not None:
+            # 限制深度时逐目录匹配，跳过过深的目录而不是过滤全部结果
+            for rel, (_, files, _, _) in self._dirs.items():
+                if rel and rel.count("/") + 1 >= max_depth:
+                    continue
+                prefix = f"{rel}/" if rel else ""
+                for name in files:
+                    if query.matches(name, prefix + name):
+                        yield prefix + name
+            return
+        paths, text, starts = snapshot
+        if query.full_path:
+            text, starts = self._full_paths(snapshot)
+        if query.match_all:
+            yield from paths
+            return
+        for match in query.multiline.finditer(text):
+            yield paths[bisect.bisect_left(starts, match.start() + 1)]
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def _join_lines(lines: list[str]) -> tuple[str, list[int]]:
+    """拼接为 "\n" + 每行 + "\n" 的文本，并返回每行的起始偏移"""
+    starts = []
+    offset = 1
+    for line in lines:
+        starts.append(offset)
+        offset += len(line) + 1
+    return "\n" + "".join(f"{line}\n" for line in lines), starts
+
+
+def index_db_path(index_dir: str, root: str) -> str:
+    """根目录对应的索引文件路径"""
+    digest = hashlib.sha1(os.path.abspath(root).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(index_dir, f"{digest}.sqlite")
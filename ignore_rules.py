@@ -0,0 +1,329 @@
+"""
+忽略规则模块 - 解析 .gitignore / .ignore，供所有遍历目录树的工具共享
+每个忽略文件编译为一个正则并按 (路径, mtime_ns, 大小) 缓存；遍历时逐层叠加各级目录的规则，
+被忽略的目录直接剪枝，不再进入
+"""
+import hashlib
+import os
+import re
+import threading
+from typing import Collection, Iterable, Optional
+
+
+def _pattern_to_regex(pattern: str) -> str:
+    """
+    将 gitignore 模式（已去掉 ! 前缀和首尾的 /）转换为匹配相对路径的正则（不含锚点）
+
+    - * ? [...] 不匹配路径分隔符，\\ 转义下一个字符
+    - 开头的 **/ 和中间的 /**/ 匹配零个或多个目录，结尾的 /** 匹配目录内的全部内容
+    """
+    i, n = 0, len(pattern)
+    parts = []
+    while i < n:
+        c = pattern[i]
+        if c == "\\" and i + 1 < n:
+            i += 1
+            parts.append(re.escape(pattern[i]))
+        elif c == "*":
+            if pattern.startswith("**", i) and (i == 0 or pattern[i - 1] == "/"):
+                if i + 2 == n:
+                    parts.append(".*")
+                    break
+                if pattern[i + 2] == "/":
+                    parts.append("(?:.*/)?")
+                    i += 3
+                    continue
+            # 其余连续的 * 等同于单个 *
+            while i + 1 < n and pattern[i + 1] == "*":
+                i += 1
+            parts.append("[^/]*")
+        elif c == "?":
+            parts.append("[^/]")
+        elif c == "[":
+            j = i + 1
+            if j < n and pattern[j] in "!^":
+                j += 1
+            if j < n and pattern[j] == "]":
+                j += 1
+            j = pattern.find("]", j)
+            if j == -1:
+                parts.append("\\[")
+            else:
+                body = pattern[i + 1:j]
+                negate = body[:1] in ("!", "^")
+                if negate:
+                    body = body[1:]
+                body = body.replace("\\", "\\\\").replace("[", "\\[")
+                parts.append(("[^" if negate else "[") + body + "]")
+                i = j
+        else:
+            parts.append(re.escape(c))
+        i += 1
+    return "".join(parts)
+
+
+def _parse_line(line: str) -> Optional[tuple[str, bool, bool, bool]]:
+    """
+    解析忽略文件中的一行
+
+    Returns:
+        (正则, 是否为 ! 取反规则, 是否只匹配目录, 是否匹配相对路径)；空行和注释返回 None
+    """
+    if not line or line.startswith("#"):
+        return None
+    # 去掉未转义的行尾空格
+    stripped = line.rstrip(" ")
+    if stripped != line and stripped.endswith("\\"):
+        stripped += " "
+    line = stripped
+    negate = line.startswith("!")
+    if negate:
+        line = line[1:]
+    dir_only = line.endswith("/")
+    if dir_only:
+        line = line[:-1]
+    # 含 / 的模式相对忽略文件所在目录匹配，否则匹配任意层级的条目名
+    anchored = "/" in line
+    if line.startswith("/"):
+        line = line[1:]
+    if not line:
+        return None
+    return _pattern_to_regex(line), negate, dir_only, anchored
+
+
+def _compile(rules: list[tuple[str, bool, bool, bool]], is_dir: bool, anchored: bool) -> Optional[tuple[re.Pattern, list]]:
+    """
+    把一类规则倒序拼成一个分组选择正则
+
+    Returns:
+        (正则, 分组编号 -> (规则序号, 是否忽略))；没有这类规则时返回 None
+    """
+    selected = [
+        (index, rule) for index, rule in reversed(list(enumerate(rules)))
+        if rule[3] == anchored and (is_dir or not rule[2])
+    ]
+    if not selected:
+        return None
+    regex = re.compile("|".join(f"({rule[0]})" for _, rule in selected))
+    return regex, [None] + [(index, not rule[1]) for index, rule in selected]
+
+
+class IgnoreFile:
+    """
+    单个忽略文件（或一组默认模式）编译后的规则
+
+    同一文件内后出现的规则优先：规则倒序拼成一个分组选择正则，fullmatch 命中的
+    第一个分支就是最后一条匹配的规则，由分组编号判断它是否为 ! 取反规则。
+    不含 / 的规则只匹配条目名，含 / 的规则匹配相对路径，两类各编译一个正则，
+    都命中时取序号靠后的规则。
+    """
+
+    __slots__ = ("key", "base", "lead", "_files", "_dirs")
+
+    def __init__(self, lines: Iterable[str], base: str = "", lead: str = "", key: str = ""):
+        """
+        编译忽略规则
+
+        Args:
+            lines: 忽略文件的各行
+            base: 忽略文件所在目录相对遍历根目录的路径，根目录为 ""
+            lead: 遍历根目录相对忽略文件所在目录的路径（以 / 结尾），用于根目录以上的忽略文件
+            key: 文件标识，文件内容变化时随之变化
+        """
+        self.key = key
+        self.base = base
+        self.lead = lead
+        rules = [rule for rule in map(_parse_line, lines) if rule is not None]
+        # (条目名规则, 路径规则)，两者都为 None 时记为 None
+        self._files = self._pair(_compile(rules, False, False), _compile(rules, False, True))
+        self._dirs = self._pair(_compile(rules, True, False), _compile(rules, True, True))
+
+    @staticmethod
+    def _pair(by_name, by_path):
+        return None if by_name is None and by_path is None else (by_name, by_path)
+
+    def match(self, prefix: str, name: str, is_dir: bool) -> Optional[bool]:
+        """
+        匹配目录 prefix（相对遍历根目录，非空时以 / 结尾）中名为 name 的条目
+
+        Returns:
+            True 表示忽略，False 表示被 ! 规则重新包含，None 表示没有规则匹配
+        """
+        compiled = self._dirs if is_dir else self._files
+        if compiled is None:
+            return None
+        by_name, by_path = compiled
+        found = None
+        if by_name is not None:
+            match = by_name[0].fullmatch(name)
+            if match is not None:
+                found = by_name[1][match.lastindex]
+        if by_path is not None:
+            if self.base:
+                prefix = prefix[len(self.base) + 1:]
+            match = by_path[0].fullmatch(self.lead + prefix + name)
+            if match is not None:
+                rule = by_path[1][match.lastindex]
+                if found is None or rule[0] > found[0]:
+                    found = rule
+        return None if found is None else found[1]
+
+    def has_rules(self, is_dir: bool) -> bool:
+        """是否有适用于文件（或目录）的规则"""
+        return (self._dirs if is_dir else self._files) is not None
+
+    def name_rules(self, is_dir: bool) -> Optional[tuple[re.Pattern, list]]:
+        """适用的规则都只匹配条目名时返回 (正则, 分组编号 -> (规则序号, 是否忽略))，否则返回 None"""
+        compiled = self._dirs if is_dir else self._files
+        if compiled is None or compiled[1] is not None:
+            return None
+        return compiled[0]
+
+
+class IgnoreRules:
+    """
+    对某个目录生效的全部忽略文件，按优先级从低到高排列
+
+    对象不可变，可在线程间共享；key 由各忽略文件的标识计算，任一文件变化时随之变化。
+    """
+
+    __slots__ = ("files", "key", "_file_order", "_dir_order")
+
+    def __init__(self, files: tuple[IgnoreFile, ...]):
+        self.files = files
+        self.key = hashlib.sha1("\n".join(f.key for f in files).encode("utf-8", "surrogateescape")).hexdigest()[:16]
+        # 按优先级从高到低，只保留有相应规则的文件（默认模式通常只有目录规则）
+        self._file_order = tuple(f for f in reversed(files) if f.has_rules(False))
+        self._dir_order = tuple(f for f in reversed(files) if f.has_rules(True))
+
+    def ignored(self, rel_path: str, is_dir: bool) -> bool:
+        """判断相对遍历根目录的路径是否被忽略，优先级最高的匹配规则决定结果"""
+        split = rel_path.rfind("/") + 1
+        return self._ignored(rel_path[:split], rel_path[split:], is_dir)
+
+    def filter(self, prefix: str, names: list[str], is_dir: bool) -> list[str]:
+        """过滤掉目录 prefix（非空时以 / 结尾）中被忽略的条目名，没有相应规则时原样返回"""
+        order = self._dir_order if is_dir else self._file_order
+        if not order:
+            return names
+        if len(order) == 1:
+            # 常见情况：只有一个忽略文件且规则都只匹配条目名，直接用正则过滤
+            name_rules = order[0].name_rules(is_dir)
+            if name_rules is not None:
+                fullmatch, results = name_rules[0].fullmatch, name_rules[1]
+                return [name for name in names if not ((match := fullmatch(name)) and results[match.lastindex][1])]
+        return [name for name in names if not self._ignored(prefix, name, is_dir)]
+
+    def _ignored(self, prefix: str, name: str, is_dir: bool) -> bool:
+        for ignore_file in self._dir_order if is_dir else self._file_order:
+            result = ignore_file.match(prefix, name, is_dir)
+            if result is not None:
+                return result
+        return False
+
+
+class IgnoreMatcher:
+    """
+    某个遍历根目录的忽略规则
+
+    - 默认模式优先级最低，其次是所在 Git 仓库的 .git/info/exclude 及根目录以上各级目录的忽略文件
+    - 各级目录中的忽略文件对该目录及其子目录生效，越深的目录优先级越高，同一目录中排在后面的文件优先
+    - 不能重新包含已被忽略的目录中的条目：遍历时被忽略的目录整体剪枝
+    - 编译结果按 (路径, mtime_ns, 大小) 缓存，忽略文件修改后下次遍历自动重新编译
+    """
+
+    def __init__(self, root: str, default_patterns: Iterable[str] = (), ignore_files: Iterable[str] = (".gitignore", ".ignore")):
+        """
+        初始化忽略规则（不立即读取文件）
+
+        Args:
+            root: 遍历根目录
+            default_patterns: 默认忽略模式（gitignore 语法）
+            ignore_files: 各级目录中读取的忽略文件名，排在后面的优先
+        """
+        self.root = os.path.abspath(root)
+        self.ignore_files = tuple(ignore_files)
+        default_patterns = list(default_patterns)
+        self._defaults = IgnoreFile(default_patterns, key="\0defaults\0" + "\0".join(default_patterns))
+        self._compiled: dict[str, IgnoreFile] = {}
+        self._lock = threading.Lock()
+        # 根目录以上需要读取的 (忽略文件路径, lead)，首次使用时查找
+        self._ancestors: Optional[list[tuple[str, str]]] = None
+
+    def root_rules(self) -> IgnoreRules:
+        """在根目录生效的规则（不含根目录自身的忽略文件，由 dir_rules 加入）"""
+        files = [self._defaults]
+        for path, lead in self._ancestor_files():
+            ignore_file = self._load(path, "", lead)
+            if ignore_file is not None:
+                files.append(ignore_file)
+        return IgnoreRules(tuple(files))
+
+    def dir_rules(self, rel: str, names: Collection[str], parent: IgnoreRules) -> IgnoreRules:
+        """
+        在目录 rel 中生效的规则：上一级的规则加上该目录自身的忽略文件
+
+        Args:
+            rel: 目录相对根目录的路径，根目录为 ""
+            names: 目录中的条目名，用于判断是否存在忽略文件，不额外 stat
+            parent: 上一级目录的规则，根目录传 root_rules()
+        """
+        added = []
+        for name in self.ignore_files:
+            if name in names:
+                ignore_file = self._load(os.path.join(self.root, rel, name), rel, "")
+                if ignore_file is not None:
+                    added.append(ignore_file)
+        if not added:
+            return parent
+        return IgnoreRules(parent.files + tuple(added))
+
+    def _ancestor_files(self) -> list[tuple[str, str]]:
+        """根目录位于 Git 仓库内时，返回仓库根目录到根目录上一级之间的忽略文件"""
+        if self._ancestors is not None:
+            return self._ancestors
+        ancestors = []
+        directory = self.root
+        while not os.path.exists(os.path.join(directory, ".git")):
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                # 不在 Git 仓库内，不读取根目录以上的文件
+                ancestors = []
+                break
+            directory = parent
+            ancestors.append(directory)
+        else:
+            top = directory
+            ancestors.reverse()
+            files = [(os.path.join(top, ".git", "info", "exclude"), self._lead(top))]
+            for directory in ancestors:
+                lead = self._lead(directory)
+                files.extend((os.path.join(directory, name), lead) for name in self.ignore_files)
+            ancestors = files
+        self._ancestors = ancestors
+        return ancestors
+
+    def _lead(self, directory: str) -> str:
+        rel = os.path.relpath(self.root, directory)
+        return "" if rel == "." else rel.replace(os.sep, "/") + "/"
+
+    def _load(self, path: str, base: str, lead: str) -> Optional[IgnoreFile]:
+        """读取并编译忽略文件，未修改时复用缓存；文件不存在或无法读取时返回 None"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = f"{path}\0{stat.st_mtime_ns}\0{stat.st_size}"
+        with self._lock:
+            cached = self._compiled.get(path)
+        if cached is not None and cached.key == key:
+            return cached
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return None
+        ignore_file = IgnoreFile(lines, base, lead, key)
+        with self._lock:
+            self._compiled[path] = ignore_file
+        return ignore_file
@@ -0,0 +1,162 @@
+"""
+LLM 响应缓存模块 - 基于 SQLite 的本地磁盘缓存
+相同的 模型 + 消息 + 工具 请求直接返回缓存的回复，用于重放任务和回归测试
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+def make_cache_key(model: str, messages: list[dict], tools: Optional[list[dict]] = None, tools_json: Optional[bytes] = None, **params) -> str:
+    """
+    计算请求的稳定哈希
+
+    请求先规范化（键排序、紧凑分隔符）再序列化，保证字段顺序不同的等价请求得到相同的键。
+    tools_json 为已规范化序列化的工具定义（tools.get_tools_json），提供时不再重复序列化 tools。
+    """
+    payload = {
+        "model": model,
+        "messages": messages,
+        "params": params
+    }
+    if tools_json is None:
+        tools_json = json.dumps(tools or [], sort_keys=True, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    digest = hashlib.sha256(canonical.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(tools_json)
+    return digest.hexdigest()
+
+
+def message_to_dict(message) -> dict:
+    """将 LLM 回复消息转换为可序列化的字典"""
+    return {
+        "content": message.content,
+        "tool_calls": [
+            {
+                "id": tc.id,
+                "name": tc.function.name,
+                "arguments": tc.function.arguments
+            }
+            for tc in message.tool_calls or []
+        ]
+    }
+
+
+class ResponseCache:
+    """
+    LLM 响应磁盘缓存
+
+    - 数据存放在单个 SQLite 文件中，多线程共享一个连接（加锁）
+    - 超过 ttl 秒的条目视为过期
+    - 总大小超过 max_bytes 时按最近访问时间淘汰（LRU）；总大小在打开时统计一次，
+      之后随写入和删除增量维护，写入时不再扫描全表
+    """
+
+    def __init__(self, path: str = ".llm_cache.sqlite", max_bytes: int = 256 * 1024 * 1024, ttl: Optional[float] = None):
+        """
+        初始化响应缓存
+
+        Args:
+            path: SQLite 文件路径
+            max_bytes: 缓存总大小上限（字节）
+            ttl: 条目有效期（秒），None 表示永不过期
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses (accessed_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_created ON responses (created_at)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> Optional[dict]:
+        """读取缓存，未命中或已过期返回 None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, size, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, size, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self._total_bytes -= size
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(value)
+
+    def put(self, key: str, value: dict):
+        """写入缓存，并在超出大小上限时淘汰最久未访问的条目"""
+        data = json.dumps(value, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, data, size, now, now)
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """删除过期条目，再按 LRU 淘汰到大小上限以内（调用方持有锁）"""
+        if self.ttl is not None:
+            expired = self._conn.execute(
+                "SELECT key, size FROM responses WHERE created_at < ?", (time.time() - self.ttl,)
+            ).fetchall()
+            self._delete(expired)
+        if self._total_bytes <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at ASC")
+        victims = []
+        excess = self._total_bytes - self.max_bytes
+        for key, size in rows:
+            if excess <= 0:
+                break
+            victims.append((key, size))
+            excess -= size
+        self._delete(victims)
+
+    def _delete(self, rows: list[tuple[str, int]]):
+        """删除 (key, size) 对应的条目并更新总大小（调用方持有锁）"""
+        if not rows:
+            return
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", [(key,) for key, _ in rows])
+        self._total_bytes -= sum(size for _, size in rows)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._total_bytes = 0
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
@@ -3,9 +3,17 @@
 ReAct Agent 入口文件
 演示 ReAct 架构的工作流程
 """
+import argparse
+import json
 import os
+import sys
+import threading
 from dotenv import load_dotenv
-from agent import ReActAgent, MultiAgentRouter
+import tools
+from agent import ReActAgent, MultiAgentRouter, run_many
+from context import ContextManager
+from llm_cache import ResponseCache
+from tracing import Tracer
 
 # 加载 .env 文件
 load_dotenv()
@@ -14,6 +22,32 @@ load_dotenv()
 API_KEY = os.getenv("API_KEY", "")
 BASE_URL = os.getenv("BASE_URL", "https://api.minimax.chat/v1")
 MODEL = os.getenv("MODEL", "MiniMax-M2.1")
+# 交互模式的上下文 token 预算
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "32000"))
+# LLM 响应缓存文件，留空则不启用
+LLM_CACHE = os.getenv("LLM_CACHE", "")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "0")) or None
+# 路由器 LLM 分类决策日志（JSONL），可用于训练本地意图分类模型
+ROUTER_DECISION_LOG = os.getenv("ROUTER_DECISION_LOG", "") or None
+# 链路追踪输出文件（JSON Lines），留空则不启用
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+# search_files 文件索引的持久化目录，留空则只保存在内存中；FILE_INDEX=0 关闭索引
+tools.FILE_INDEX_DIR = os.getenv("FILE_INDEX_DIR", "") or None
+tools.FILE_INDEX_ENABLED = os.getenv("FILE_INDEX", "1") != "0"
+
+
+def create_cache():
+    """根据环境变量创建响应缓存"""
+    if not LLM_CACHE:
+        return None
+    return ResponseCache(LLM_CACHE, ttl=LLM_CACHE_TTL)
+
+
+def create_tracer():
+    """根据环境变量创建链路追踪器"""
+    if not TRACE_FILE:
+        return None
+    return Tracer(TRACE_FILE)
 
 
 def demo_single_agent():
@@ -26,7 +60,9 @@ def demo_single_agent():
         api_key=API_KEY,
         base_url=BASE_URL,
         model=MODEL,
-        verbose=True
+        verbose=True,
+        cache=create_cache(),
+        tracer=create_tracer()
     )
     
     # 示例任务
@@ -49,7 +85,8 @@ def demo_multi_agent():
     
     router = MultiAgentRouter(
         api_key=API_KEY,
-        base_url=BASE_URL
+        base_url=BASE_URL,
+        decision_log=ROUTER_DECISION_LOG
     )
     
     tasks = [
@@ -76,7 +113,10 @@ def interactive_mode():
         api_key=API_KEY,
         base_url=BASE_URL,
         model=MODEL,
-        verbose=True
+        verbose=True,
+        context_manager=ContextManager(max_tokens=CONTEXT_TOKEN_BUDGET),
+        tracer=create_tracer(),
+        persistent_shell=True
     )
     
     while True:
@@ -104,8 +144,84 @@ def interactive_mode():
             print(f"[错误]: {e}")
 
 
+def batch_mode(argv: list[str]) -> int:
+    """
+    批量模式 - 从 JSONL 读取任务，并发执行后按输入顺序写出结果 JSONL
+    
+    输入每行为 JSON 字符串或 {"task": "...", "id": ...} 对象
+    """
+    parser = argparse.ArgumentParser(prog="batch", description="批量并发执行任务")
+    parser.add_argument("--input", required=True, help="任务文件 (JSONL)")
+    parser.add_argument("--output", required=True, help="结果文件 (JSONL)")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发任务数")
+    parser.add_argument("--max-iterations", type=int, default=10, help="每个任务的最大迭代次数")
+    args = parser.parse_args(argv)
+    
+    records = []
+    with open(args.input, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"task": record}
+            records.append(record)
+    
+    done = 0
+    lock = threading.Lock()
+    
+    def on_result(item: dict):
+        nonlocal done
+        with lock:
+            done += 1
+            status = "失败" if item["error"] else "完成"
+            print(f"[{done}/{len(records)}] 任务 {item['index']} {status}")
+    
+    batch = run_many(
+        [r["task"] for r in records],
+        concurrency=args.concurrency,
+        api_key=API_KEY,
+        base_url=BASE_URL,
+        model=MODEL,
+        on_result=on_result,
+        max_iterations=args.max_iterations,
+        cache=create_cache(),
+        tracer=create_tracer()
+    )
+    
+    with open(args.output, "w", encoding="utf-8") as f:
+        for record, item in zip(records, batch.results):
+            f.write(json.dumps({
+                "id": record.get("id", item["index"]),
+                "task": item["task"],
+                "answer": item["answer"],
+                "error": item["error"],
+                "stats": item["stats"]
+            }, ensure_ascii=False) + "\n")
+    
+    print(f"\n完成 {batch.succeeded}/{len(batch.results)} 个任务，"
+          f"耗时 {batch.wall_time:.1f}s，吞吐 {batch.throughput:.2f} 任务/秒，"
+          f"共 {batch.total_tokens} tokens")
+    return 0 if batch.succeeded == len(batch.results) else 1
+
+
+def run_subcommand(name: str, argv: list[str]) -> int:
+    """执行子命令，如 `python main.py bench --files 10000`"""
+    if name == "bench":
+        from bench import main as bench_main
+        return bench_main(argv)
+    if name == "batch":
+        return batch_mode(argv)
+    print(f"[错误]: 未知子命令 '{name}'，可用: bench, batch")
+    return 2
+
+
 def main():
     """主函数"""
+    if len(sys.argv) > 1:
+        return run_subcommand(sys.argv[1], sys.argv[2:])
+    
     print("""
 ╔══════════════════════════════════════════════════════════════════════╗
 ║                    ReAct Agent - 推理与行动循环                        ║
@@ -145,4 +261,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
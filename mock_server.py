@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+本地 Mock LLM 服务 - 兼容 OpenAI chat.completions 协议
+按脚本化的轨迹返回回复（支持 tool_calls 与流式输出），可配置延迟分布和错误注入，
+用于在无网络环境下压测 Agent 循环
+
+用法:
+    python mock_server.py --port 8765 --script script.json --latency lognormal:-2,0.5
+    BASE_URL=http://127.0.0.1:8765/v1 python main.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from context import estimate_messages_tokens, estimate_tokens
+
+# 默认脚本：覆盖 main.py 中的演示任务
+# 每条轨迹按 match 匹配最后一条用户消息，steps 按本轮已有的 assistant 消息数依次返回
+DEFAULT_SCRIPT = {
+    "trajectories": [
+        {
+            "match": "任务分类专家",
+            "system": True,
+            "steps": [{"content": "general"}]
+        },
+        {
+            "match": "列出",
+            "steps": [
+                {"content": "我先列出目录。", "tool_calls": [{"name": "list_dir", "arguments": {"path": "."}}]},
+                {"content": "目录内容如上。"}
+            ]
+        },
+        {
+            "match": "计算",
+            "steps": [
+                {"content": "使用计算器。", "tool_calls": [{"name": "calculator", "arguments": {"expression": "(15 + 27) * 3 - 18 / 2"}}]},
+                {"content": "结果是 117.0。"}
+            ]
+        },
+        {
+            "match": "Python 文件",
+            "steps": [
+                {"tool_calls": [{"name": "search_files", "arguments": {"pattern": "*.py"}}]},
+                {"content": "找到了上述 Python 文件。"}
+            ]
+        },
+        {
+            "match": "echo",
+            "steps": [
+                {"tool_calls": [{"name": "bash", "arguments": {"command": "echo 'Hello ReAct!'"}}]},
+                {"content": "命令已执行。"}
+            ]
+        }
+    ]
+}
+
+
+class LatencyModel:
+    """
+    延迟分布
+
+    规格格式: fixed:秒 | uniform:最小,最大 | normal:均值,标准差 | lognormal:mu,sigma
+    """
+
+    def __init__(self, spec: str = "fixed:0", rng: Optional[random.Random] = None):
+        kind, _, args = spec.partition(":")
+        self.kind = kind
+        self.args = [float(x) for x in args.split(",")] if args else [0.0]
+        self.rng = rng or random.Random()
+        if kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"未知的延迟分布: {spec}")
+
+    def sample(self) -> float:
+        """采样一次延迟（秒）"""
+        if self.kind == "fixed":
+            return self.args[0]
+        if self.kind == "uniform":
+            return self.rng.uniform(self.args[0], self.args[1])
+        if self.kind == "normal":
+            return max(0.0, self.rng.gauss(self.args[0], self.args[1]))
+        return self.rng.lognormvariate(self.args[0], self.args[1])
+
+
+class MockLLM:
+    """根据脚本生成回复，与 HTTP 层无关，便于在进程内直接使用"""
+
+    def __init__(self, script: Optional[dict] = None):
+        self.script = script or DEFAULT_SCRIPT
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def _next_id(self) -> str:
+        with self._lock:
+            self._counter += 1
+            return f"call_{self._counter}_{uuid.uuid4().hex[:8]}"
+
+    def step_for(self, messages: list[dict]) -> dict:
+        """
+        选择当前请求对应的脚本步骤
+
+        轨迹按 match 匹配最后一条用户消息（system=True 的轨迹匹配系统提示），
+        步骤序号为最后一条用户消息之后的 assistant 消息数，因此服务端无需保存会话状态。
+        """
+        last_user = 0
+        for i, message in enumerate(messages):
+            if message.get("role") == "user":
+                last_user = i
+        user_text = (messages[last_user].get("content") or "") if messages else ""
+        system_text = ""
+        if messages and messages[0].get("role") == "system":
+            system_text = messages[0].get("content") or ""
+        step_index = sum(1 for m in messages[last_user:] if m.get("role") == "assistant")
+
+        for trajectory in self.script.get("trajectories", []):
+            text = system_text if trajectory.get("system") else user_text
+            if trajectory.get("match", "") in text:
+                steps = trajectory["steps"]
+                return steps[min(step_index, len(steps) - 1)]
+        return {"content": f"[mock] {user_text}"}
+
+    def reply(self, messages: list[dict]) -> tuple[Optional[str], list[dict]]:
+        """生成回复内容与工具调用列表"""
+        step = self.step_for(messages)
+        tool_calls = [
+            {
+                "id": self._next_id(),
+                "type": "function",
+                "function": {
+                    "name": tc["name"],
+                    "arguments": json.dumps(tc.get("arguments", {}), ensure_ascii=False)
+                }
+            }
+            for tc in step.get("tool_calls", [])
+        ]
+        return step.get("content"), tool_calls
+
+
+class MockServer(ThreadingHTTPServer):
+    """Mock LLM HTTP 服务"""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        llm: MockLLM,
+        latency: LatencyModel,
+        token_delay: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        seed: Optional[int] = None
+    ):
+        super().__init__(address, MockHandler)
+        self.llm = llm
+        self.latency = latency
+        self.token_delay = token_delay
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rng = random.Random(seed)
+        self.request_count = 0
+        self._count_lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """chat.completions 协议处理"""
+
+    server: MockServer
+    # 支持 keep-alive，便于测量连接池的效果
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        """关闭默认的访问日志"""
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        with server._count_lock:
+            server.request_count += 1
+
+        time.sleep(server.latency.sample())
+
+        if server.error_rate and server.rng.random() < server.error_rate:
+            self._send_json(server.error_status, {
+                "error": {"message": "injected error", "type": "mock_error", "code": server.error_status}
+            })
+            return
+
+        messages = request.get("messages", [])
+        content, tool_calls = server.llm.reply(messages)
+        prompt_tokens = estimate_messages_tokens(messages)
+        completion_tokens = estimate_tokens(content or "") + sum(
+            estimate_tokens(tc["function"]["arguments"]) for tc in tool_calls
+        )
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+        model = request.get("model", "mock")
+
+        if request.get("stream"):
+            include_usage = (request.get("stream_options") or {}).get("include_usage", False)
+            self._stream(model, content, tool_calls, usage if include_usage else None)
+            return
+
+        self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": content,
+                    "tool_calls": tool_calls or None
+                },
+                "finish_reason": "tool_calls" if tool_calls else "stop"
+            }],
+            "usage": usage
+        })
+
+    def _stream(self, model: str, content: Optional[str], tool_calls: list[dict], usage: Optional[dict]):
+        """以 SSE 形式逐块发送回复"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        # 流式响应没有 Content-Length，发送完毕后关闭连接
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        def send(delta: dict, finish_reason: Optional[str] = None, chunk_usage: Optional[dict] = None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+            }
+            if chunk_usage is not None:
+                chunk["usage"] = chunk_usage
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if self.server.token_delay:
+                time.sleep(self.server.token_delay)
+
+        send({"role": "assistant", "content": ""})
+        text = content or ""
+        for i in range(0, len(text), 4):
+            send({"content": text[i:i + 4]})
+        for index, tc in enumerate(tool_calls):
+            send({"tool_calls": [{
+                "index": index,
+                "id": tc["id"],
+                "type": "function",
+                "function": {"name": tc["function"]["name"], "arguments": ""}
+            }]})
+            arguments = tc["function"]["arguments"]
+            for i in range(0, len(arguments), 8):
+                send({"tool_calls": [{"index": index, "function": {"arguments": arguments[i:i + 8]}}]})
+        send({}, finish_reason="tool_calls" if tool_calls else "stop")
+        if usage is not None:
+            send(None, chunk_usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def start_mock_server(
+    script: Optional[dict] = None,
+    host: str = "127.0.0.1",
+    port: int = 0,
+    latency: str = "fixed:0",
+    token_delay: float = 0.0,
+    error_rate: float = 0.0,
+    error_status: int = 500,
+    seed: Optional[int] = None
+) -> MockServer:
+    """
+    在后台线程启动 Mock 服务
+
+    Args:
+        script: 轨迹脚本，默认使用 DEFAULT_SCRIPT
+        host: 监听地址
+        port: 监听端口，0 表示随机端口
+        latency: 每个请求的延迟分布
+        token_delay: 流式输出时每个分块之间的延迟（秒）
+        error_rate: 注入错误的概率
+        error_status: 注入错误时返回的 HTTP 状态码
+        seed: 随机种子
+
+    Returns:
+        已启动的服务，通过 server.base_url 获取地址，server.shutdown() 停止
+    """
+    rng = random.Random(seed)
+    server = MockServer(
+        (host, port),
+        MockLLM(script),
+        LatencyModel(latency, rng),
+        token_delay=token_delay,
+        error_rate=error_rate,
+        error_status=error_status,
+        seed=seed
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 Mock LLM 服务（OpenAI chat.completions 协议）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--script", help="轨迹脚本 JSON 文件，默认使用内置演示脚本")
+    parser.add_argument("--latency", default="fixed:0", help="延迟分布，如 fixed:0.1 / uniform:0.05,0.2 / lognormal:-2,0.5")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="流式分块间延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="错误注入概率")
+    parser.add_argument("--error-status", type=int, default=500, help="注入错误的 HTTP 状态码")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    args = parser.parse_args()
+
+    script = None
+    if args.script:
+        with open(args.script, "r", encoding="utf-8") as f:
+            script = json.load(f)
+
+    server = start_mock_server(
+        script,
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        token_delay=args.token_delay,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed
+    )
+    print(f"Mock LLM 服务已启动: {server.base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        print("\n已停止")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+"""
+Shell 执行模块 - 为 bash 工具提供有界输出捕获和常驻 shell
+- run_command: 单次执行命令，增量读取输出，只保留头尾窗口，超过硬上限时终止进程组
+- ShellSession: 常驻 shell，同一会话中的命令共享工作目录、环境变量和激活的虚拟环境
+"""
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+
+# 每个输出流默认保留的头部/尾部字节数
+DEFAULT_HEAD_BYTES = 16 * 1024
+DEFAULT_TAIL_BYTES = 16 * 1024
+# 默认输出总量硬上限（stdout + stderr），超过后终止进程组
+DEFAULT_MAX_OUTPUT_BYTES = 64 * 1024 * 1024
+# 常驻 shell 的尾部窗口下限，保证结束标记完整落在尾部中
+_MIN_SESSION_TAIL_BYTES = 4096
+
+
+class ShellTimeout(Exception):
+    """命令执行超时"""
+
+
+class OutputCapture:
+    """
+    有界输出缓冲
+
+    只保留最前面 head_bytes 和最后面 tail_bytes 字节，中间部分只计数，
+    内存占用与输出总量无关。
+    """
+
+    def __init__(self, head_bytes: int = DEFAULT_HEAD_BYTES, tail_bytes: int = DEFAULT_TAIL_BYTES):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total_bytes = 0
+        self.total_lines = 0
+
+    def write(self, chunk: bytes):
+        """追加一段输出"""
+        self.total_bytes += len(chunk)
+        self.total_lines += chunk.count(b"\n")
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += chunk[:room]
+            chunk = chunk[room:]
+        if chunk:
+            self.tail += chunk
+            if len(self.tail) > self.tail_bytes:
+                del self.tail[:len(self.tail) - self.tail_bytes]
+
+    @property
+    def omitted_bytes(self) -> int:
+        return self.total_bytes - len(self.head) - len(self.tail)
+
+    @property
+    def omitted_lines(self) -> int:
+        return max(0, self.total_lines - self.head.count(b"\n") - self.tail.count(b"\n"))
+
+    def render(self, tail: Optional[bytes] = None) -> str:
+        """
+        解码为文本，非 UTF-8 字节以替换字符表示
+
+        Args:
+            tail: 替换尾部内容（常驻 shell 用于去掉结束标记），默认使用缓冲的尾部
+        """
+        tail = bytes(self.tail) if tail is None else tail
+        if self.omitted_bytes == 0:
+            return (bytes(self.head) + tail).decode("utf-8", errors="replace")
+        return (
+            f"{self.head.decode('utf-8', errors='replace')}"
+            f"\n...[已省略 {self.omitted_bytes} 字节，约 {self.omitted_lines} 行]...\n"
+            f"{tail.decode('utf-8', errors='replace')}"
+        )
+
+
+@dataclass
+class CommandResult:
+    """命令执行结果"""
+    stdout: str
+    stderr: str
+    returncode: int
+    # 输出超过硬上限，进程已被终止
+    output_limited: bool = False
+
+
+def kill_process_group(process: subprocess.Popen):
+    """终止进程及其所有子进程"""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def run_command(
+    command: str,
+    timeout: float = 60,
+    head_bytes: int = DEFAULT_HEAD_BYTES,
+    tail_bytes: int = DEFAULT_TAIL_BYTES,
+    max_output_bytes: int = DEFAULT_MAX_OUTPUT_BYTES
+) -> CommandResult:
+    """
+    执行一条 shell 命令，增量读取 stdout/stderr
+
+    Args:
+        command: shell 命令
+        timeout: 超时时间（秒）
+        head_bytes: 每个流保留的头部字节数
+        tail_bytes: 每个流保留的尾部字节数
+        max_output_bytes: 输出总量硬上限，超过后终止进程组
+
+    Raises:
+        ShellTimeout: 超时，进程组已被终止
+    """
+    process = subprocess.Popen(
+        command,
+        shell=True,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+    )
+    captures = {"stdout": OutputCapture(head_bytes, tail_bytes), "stderr": OutputCapture(head_bytes, tail_bytes)}
+    lock = threading.Lock()
+    limited = threading.Event()
+
+    def reader(name: str, stream):
+        fd = stream.fileno()
+        while True:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                return
+            with lock:
+                captures[name].write(chunk)
+                total = captures["stdout"].total_bytes + captures["stderr"].total_bytes
+                if total > max_output_bytes and not limited.is_set():
+                    limited.set()
+                    kill_process_group(process)
+
+    threads = [
+        threading.Thread(target=reader, args=(name, stream), daemon=True)
+        for name, stream in (("stdout", process.stdout), ("stderr", process.stderr))
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        returncode = process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        kill_process_group(process)
+        process.wait()
+        raise ShellTimeout(f"命令执行超时（{timeout}秒）")
+    finally:
+        for thread in threads:
+            # 脱离进程组的后台进程可能仍持有管道，不无限等待
+            thread.join(timeout=1)
+
+    with lock:
+        return CommandResult(
+            stdout=captures["stdout"].render(),
+            stderr=captures["stderr"].render(),
+            returncode=returncode,
+            output_limited=limited.is_set(),
+        )
+
+
+class ShellSession:
+    """
+    常驻 shell 会话
+
+    命令通过管道写入 shell，执行完毕后在 stdout/stderr 各输出一行唯一的结束标记，
+    读取线程据此切分每条命令的输出、退出码和执行后的工作目录。输出与 run_command 一样只保留头尾窗口；
+    命令超时或输出超过硬上限时整个进程组被终止，下一条命令会自动启动新的 shell。
+    """
+
+    def __init__(self, shell: Optional[str] = None, cwd: Optional[str] = None, env: Optional[dict] = None):
+        """
+        初始化 shell 会话（首次执行命令时才启动进程）
+
+        Args:
+            shell: shell 路径，默认优先使用 bash
+            cwd: 初始工作目录
+            env: 环境变量，默认继承当前进程
+        """
+        self.shell = shell or shutil.which("bash") or "/bin/sh"
+        self._is_bash = os.path.basename(self.shell) == "bash"
+        self.cwd = cwd
+        self.env = env
+        # 最近一条命令执行后的工作目录，shell 重启后清空
+        self._current_cwd: Optional[str] = None
+        self._process: Optional[subprocess.Popen] = None
+        # 保证同一时刻只有一条命令在执行
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._captures: dict[str, OutputCapture] = {}
+        self._eof: dict[str, bool] = {}
+        self._max_output_bytes = DEFAULT_MAX_OUTPUT_BYTES
+        self._limited = False
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    @property
+    def working_directory(self) -> str:
+        """shell 当前的工作目录（尚未执行命令时为初始目录）"""
+        return self._current_cwd or os.path.abspath(self.cwd or os.getcwd())
+
+    def start(self):
+        """启动 shell 进程及输出读取线程"""
+        self._process = subprocess.Popen(
+            [self.shell],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=self.cwd,
+            env=self.env,
+            start_new_session=True,
+        )
+        self._captures = {"stdout": OutputCapture(), "stderr": OutputCapture()}
+        self._eof = {"stdout": False, "stderr": False}
+        self._current_cwd = None
+        for name, stream in (("stdout", self._process.stdout), ("stderr", self._process.stderr)):
+            threading.Thread(target=self._reader, args=(self._process, name, stream), daemon=True).start()
+
+    def _reader(self, process: subprocess.Popen, name: str, stream):
+        """持续读取输出到缓冲区"""
+        fd = stream.fileno()
+        while True:
+            try:
+                chunk = os.read(fd, 65536)
+            except OSError:
+                chunk = b""
+            with self._cond:
+                # shell 已被重启，丢弃旧进程的输出
+                if process is not self._process:
+                    return
+                if not chunk:
+                    self._eof[name] = True
+                    self._cond.notify_all()
+                    return
+                capture = self._captures[name]
+                capture.write(chunk)
+                total = self._captures["stdout"].total_bytes + self._captures["stderr"].total_bytes
+                if total > self._max_output_bytes and not self._limited:
+                    self._limited = True
+                    kill_process_group(process)
+                self._cond.notify_all()
+
+    @staticmethod
+    def _visible(capture: OutputCapture) -> tuple[bytes, int]:
+        """
+        返回可用于查找结束标记的内容及其在 render 中对应的头部长度
+
+        未丢弃内容时为完整输出，否则为尾部窗口（结束标记总在输出末尾）。
+        """
+        if capture.omitted_bytes == 0:
+            return bytes(capture.head + capture.tail), len(capture.head)
+        return bytes(capture.tail), 0
+
+    def _render_before(self, name: str, end: bytes) -> str:
+        """渲染结束标记之前的输出"""
+        capture = self._captures[name]
+        data, head_len = self._visible(capture)
+        pos = data.rfind(end)
+        if head_len == 0 and capture.omitted_bytes:
+            return capture.render(data[:pos])
+        return data[:pos].decode("utf-8", errors="replace")
+
+    def run(
+        self,
+        command: str,
+        timeout: float = 60,
+        head_bytes: int = DEFAULT_HEAD_BYTES,
+        tail_bytes: int = DEFAULT_TAIL_BYTES,
+        max_output_bytes: int = DEFAULT_MAX_OUTPUT_BYTES
+    ) -> CommandResult:
+        """
+        在会话中执行命令
+
+        Args:
+            command: shell 命令
+            timeout: 超时时间（秒）
+            head_bytes: 每个流保留的头部字节数
+            tail_bytes: 每个流保留的尾部字节数
+            max_output_bytes: 输出总量硬上限，超过后终止 shell
+
+        Raises:
+            ShellTimeout: 超时，shell 已被终止
+        """
+        with self._lock:
+            if not self.alive:
+                self.start()
+
+            marker = f"__REACT_DONE_{uuid.uuid4().hex}__"
+            delimiter = f"__REACT_EOF_{uuid.uuid4().hex}__"
+            # 命令经 heredoc 原样传入再 eval，语法错误不会吞掉后面的结束标记；
+            # bash 下用内建 read 读取，避免每条命令额外 fork
+            if self._is_bash:
+                assign = f"IFS= read -r -d '' __react_cmd <<'{delimiter}'\n{command}\n{delimiter}\n"
+            else:
+                assign = f"__react_cmd=$(cat <<'{delimiter}'\n{command}\n{delimiter}\n)\n"
+            script = (
+                assign +
+                f"eval \"$__react_cmd\" < /dev/null\n"
+                f"__react_rc=$?\n"
+                f"printf '\\n{marker} %d %s\\n' \"$__react_rc\" \"$PWD\"\n"
+                f"printf '\\n{marker}\\n' >&2\n"
+            )
+            end_out = f"\n{marker} ".encode()
+            end_err = f"\n{marker}\n".encode()
+
+            with self._cond:
+                tail_bytes = max(tail_bytes, _MIN_SESSION_TAIL_BYTES)
+                self._captures = {
+                    "stdout": OutputCapture(head_bytes, tail_bytes),
+                    "stderr": OutputCapture(head_bytes, tail_bytes),
+                }
+                self._max_output_bytes = max_output_bytes
+                self._limited = False
+            try:
+                self._process.stdin.write(script.encode("utf-8"))
+                self._process.stdin.flush()
+            except (BrokenPipeError, OSError):
+                self._terminate()
+                return CommandResult("", "[shell 已退出]", -1)
+
+            deadline = time.monotonic() + timeout
+            with self._cond:
+                while True:
+                    out, _ = self._visible(self._captures["stdout"])
+                    err, _ = self._visible(self._captures["stderr"])
+                    out_pos = out.rfind(end_out)
+                    if out_pos != -1 and out.find(b"\n", out_pos + len(end_out)) != -1 and end_err in err:
+                        break
+                    if self._eof["stdout"] and self._eof["stderr"]:
+                        # 命令中执行了 exit，或输出超过上限导致 shell 被终止
+                        result = CommandResult(
+                            self._captures["stdout"].render(),
+                            self._captures["stderr"].render(),
+                            self._process.wait(),
+                            output_limited=self._limited,
+                        )
+                        self._process = None
+                        self._current_cwd = None
+                        return result
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._terminate()
+                        raise ShellTimeout(f"命令执行超时（{timeout}秒）")
+                    self._cond.wait(remaining)
+
+                rc_end = out.find(b"\n", out_pos + len(end_out))
+                rc, _, cwd = out[out_pos + len(end_out):rc_end].decode("utf-8", errors="replace").partition(" ")
+                returncode = int(rc)
+                self._current_cwd = cwd or None
+                stdout = self._render_before("stdout", end_out)
+                stderr = self._render_before("stderr", end_err)
+            return CommandResult(stdout, stderr, returncode)
+
+    def _terminate(self):
+        """终止 shell 进程组"""
+        process = self._process
+        self._process = None
+        self._current_cwd = None
+        if process is None:
+            return
+        kill_process_group(process)
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+        with self._cond:
+            self._cond.notify_all()
+
+    def restart(self):
+        """重启 shell（用于命令挂起后恢复），工作目录和环境变量回到初始状态"""
+        self._terminate()
+        self.start()
+
+    def close(self):
+        """关闭 shell"""
+        if self._process is not None and self.alive:
+            try:
+                self._process.stdin.write(b"exit\n")
+                self._process.stdin.flush()
+                self._process.wait(timeout=1)
+            except (BrokenPipeError, OSError, subprocess.TimeoutExpired):
+                pass
+        self._terminate()
@@ -0,0 +1,36 @@
+"""计算器的结果大小限制"""
+import pytest
+
+from calculator import MAX_INT_BITS, CalculatorError, evaluate
+
+
+@pytest.mark.parametrize("expression", [
+    "prod([2 ** 9000, 2 ** 9000])",
+    "math.prod([2 ** 6000], 2 ** 6000)",
+    "lcm(2 ** 9000 - 1, 2 ** 9000 + 1)",
+    "math.lcm(2 ** 6000 + 1, 3 ** 3000, 5 ** 2000)",
+    "comb(10 ** 300, 30000)",
+    "math.comb(10 ** 300, 10 ** 300 - 30000)",
+    "perm(10 ** 300, 30000)",
+    "perm(2 ** 100, 200)",
+])
+def test_large_products_are_rejected_before_computing(expression):
+    with pytest.raises(CalculatorError):
+        evaluate(expression)
+
+
+def test_small_products_still_work():
+    assert evaluate("prod([1, 2, 3, 4])") == 24
+    assert evaluate("prod([2, 3], 5)") == 30
+    assert evaluate("prod([1.5, 2])") == 3.0
+    assert evaluate("lcm(4, 6, 10)") == 60
+    assert evaluate("lcm()") == 1
+    assert evaluate("comb(2000, 1000)").bit_length() < MAX_INT_BITS
+    assert evaluate("comb(10 ** 300, 2)") == 10 ** 300 * (10 ** 300 - 1) // 2
+    assert evaluate("perm(10 ** 300, 3)") == 10 ** 300 * (10 ** 300 - 1) * (10 ** 300 - 2)
+
+
+def test_float_functions_overflow_instead_of_growing():
+    for expression in ("pow(10.0, 400)", "ldexp(1.0, 2000)", f"ldexp(1, {MAX_INT_BITS * 10})"):
+        with pytest.raises(OverflowError):
+            evaluate(expression)
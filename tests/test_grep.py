@@ -0,0 +1,59 @@
+"""grep 工具的逐行匹配语义"""
+from tools import grep_tool
+
+SOURCE = """import os
+def load(path):
+    return open(path)
+
+class Loader:
+    def run(self):
+        pass
+"""
+
+
+def _grep(tmp_path, pattern, **kwargs):
+    (tmp_path / "mod.py").write_text(SOURCE)
+    return grep_tool(pattern, str(tmp_path), **kwargs)
+
+
+def test_caret_anchors_to_line_start(tmp_path):
+    result = _grep(tmp_path, r"^def ")
+    assert "mod.py:2: def load(path):" in result
+    assert "def run" not in result
+    assert "[1 个文件中共 1 处匹配]" in result
+
+
+def test_dollar_anchors_to_line_end(tmp_path):
+    result = _grep(tmp_path, r"\)$")
+    assert "mod.py:2:" not in result
+    assert "mod.py:3:     return open(path)" in result
+    assert "mod.py:6:" not in result
+    assert "[1 个文件中共 1 处匹配]" in result
+
+
+def test_match_does_not_cross_lines(tmp_path):
+    assert _grep(tmp_path, r"os\s+def").startswith("[未找到匹配")
+    assert _grep(tmp_path, r"pass\n").startswith("[未找到匹配")
+
+
+def test_cross_line_candidate_keeps_later_match_on_same_line(tmp_path):
+    # 整体匹配时 \s* 会吞掉行尾换行，在行内重新匹配后仍应报告该行
+    result = _grep(tmp_path, r"open\(path\)\s*")
+    assert "mod.py:3:     return open(path)" in result
+    assert "[1 个文件中共 1 处匹配]" in result
+
+
+def test_dot_matches_cjk_characters(tmp_path):
+    (tmp_path / "mod.py").write_text('print("你好世界")\nlabel = "中文"\n', encoding="utf-8")
+    assert "mod.py:1: print(\"你好世界\")" in grep_tool("你.世", str(tmp_path))
+    result = grep_tool(r'"[^"]{2}"', str(tmp_path))
+    assert "mod.py:2: label = \"中文\"" in result
+    assert "mod.py:1:" not in result
+
+
+def test_ascii_pattern_matches_non_ascii_file_by_character(tmp_path):
+    (tmp_path / "mod.py").write_text("x = 'é'\nStraße\n", encoding="utf-8")
+    assert "mod.py:1: x = 'é'" in grep_tool(r"'.'", str(tmp_path))
+    assert "mod.py:2: Straße" in grep_tool(r"^\w+$", str(tmp_path))
+    assert "mod.py:2: Straße" in grep_tool("STRASSE|STRAßE", str(tmp_path), ignore_case=True)
+    assert "mod.py:1:" in grep_tool(r"\u00e9", str(tmp_path))
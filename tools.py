@@ -4,21 +4,154 @@
 import subprocess
 import os
 import json
-from typing import Callable, Any
+import re
+import asyncio
+import atexit
+import bisect
+import contextvars
+import inspect
+import itertools
+import mmap
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, Optional
+
+from calculator import evaluate
+from file_cache import FileContentCache, file_key
+from file_index import FileIndex, SearchQuery, index_db_path
+from ignore_rules import IgnoreMatcher, IgnoreRules
+from shell import ShellSession, ShellTimeout, kill_process_group, run_command
 
 # 工具注册表
 TOOLS: dict[str, dict] = {}
 
+# 注册表版本号，每次 register_tool 时递增；派生数据（LLM 工具定义等）按版本缓存
+_registry_version = 0
+# (版本号, 工具名称子集) -> (LLM 格式工具定义, 序列化后的 JSON bytes)
+_schema_cache: dict[tuple, tuple[list[dict], bytes]] = {}
+
+# bash 命令超时时间（秒）
+BASH_TIMEOUT = 60
+# bash 输出每个流保留的头部/尾部字节数，中间部分省略并注明字节数和行数
+BASH_OUTPUT_HEAD_BYTES = 8 * 1024
+BASH_OUTPUT_TAIL_BYTES = 8 * 1024
+# bash 输出总量硬上限（字节），超过后终止整个进程组
+BASH_MAX_OUTPUT_BYTES = 64 * 1024 * 1024
+
+# 后台任务：同时运行的任务数上限、保留的已结束任务数上限、每个任务保留的最近输出字节数、单次读取与等待的上限
+JOB_MAX_RUNNING = 8
+JOB_MAX_FINISHED = 16
+JOB_OUTPUT_BUFFER_BYTES = 1024 * 1024
+JOB_OUTPUT_CHUNK_BYTES = 16 * 1024
+JOB_WAIT_MAX = 600
+# 后台任务表: job_id -> BackgroundJob，按最近访问排序（最久未访问的在前）
+_jobs: OrderedDict[int, "BackgroundJob"] = OrderedDict()
+_jobs_lock = threading.Lock()
+_next_job_id = 1
+
+# read_file 单次返回的行数/字节数上限，超出时提示使用 offset 继续读取
+READ_FILE_MAX_LINES = 2000
+READ_FILE_MAX_BYTES = 256 * 1024
+# 超过该大小的文件通过 mmap 访问
+READ_FILE_MMAP_THRESHOLD = 4 * 1024 * 1024
+# 行索引：每个分块起点记录一次累计换行数，按 (路径, inode, mtime_ns, 大小) 缓存
+_LINE_INDEX_CHUNK = 1024 * 1024
+_LINE_INDEX_CACHE_SIZE = 64
+_line_index_cache: OrderedDict[tuple, tuple[int, list[int]]] = OrderedDict()
+_line_index_lock = threading.Lock()
+
+# 文件内容缓存（进程内共享），小于 READ_FILE_MMAP_THRESHOLD 的文件经此读取
+FILE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+FILE_CACHE = FileContentCache(FILE_CACHE_MAX_BYTES, max_entry_bytes=READ_FILE_MMAP_THRESHOLD)
+
+# list_dir 每页条目数上限与最大递归深度
+LIST_DIR_PAGE_SIZE = 200
+LIST_DIR_MAX_DEPTH = 10
+
+# 遍历目录树的工具（list_dir/search_files/grep）默认忽略的模式（gitignore 语法，优先级最低），
+# 另外读取各级目录中的忽略文件，排在后面的文件优先
+IGNORE_DEFAULT_PATTERNS = [".*/", "node_modules/", "__pycache__/", "venv/"]
+IGNORE_FILES = (".gitignore", ".ignore")
+_ignore_matchers: dict[str, IgnoreMatcher] = {}
+_ignore_matchers_lock = threading.Lock()
+# search_files 默认/最大返回结果数
+SEARCH_DEFAULT_LIMIT = 50
+SEARCH_MAX_LIMIT = 500
+
+# grep：并行扫描的线程数、每批文件数、默认/最大匹配数、上下文行数上限、单行最大字符数
+GREP_WORKERS = min(8, (os.cpu_count() or 1) + 4)
+GREP_BATCH_SIZE = 64
+GREP_DEFAULT_MAX_RESULTS = 100
+GREP_MAX_RESULTS = 500
+GREP_MAX_CONTEXT = 5
+GREP_MAX_LINE_CHARS = 300
+# 文件路径索引：是否启用、持久化目录（None 表示只保存在内存中）、无文件改动时的复用时间（秒）、
+# 内存中保留索引的根目录数（超出时淘汰最久未使用的）
+FILE_INDEX_ENABLED = True
+FILE_INDEX_DIR: Optional[str] = None
+FILE_INDEX_REFRESH_INTERVAL = 2.0
+FILE_INDEX_MAX_ROOTS = 4
+_file_indexes: OrderedDict[str, FileIndex] = OrderedDict()
+# 已通过遍历搜索过一次、下次搜索时再建立索引的根目录
+_file_index_pending: OrderedDict[str, None] = OrderedDict()
+_file_index_generations: dict[str, int] = {}
+_file_indexes_lock = threading.Lock()
+# 文件系统修改计数，bash/write_file/job_start 执行时递增
+_fs_generation = 0
+
+# 当前 Agent 会话的常驻 shell，未设置时 bash 工具每条命令启动新进程
+_active_shell: contextvars.ContextVar[Optional[ShellSession]] = contextvars.ContextVar("active_shell", default=None)
+
+
+@contextmanager
+def use_shell_session(session: Optional[ShellSession]) -> Iterator[None]:
+    """在上下文中让 bash 工具使用指定的常驻 shell 会话"""
+    token = _active_shell.set(session)
+    try:
+        yield
+    finally:
+        _active_shell.reset(token)
+
+
+def _resolve_path(path: str) -> str:
+    """
+    按常驻 shell 的当前目录解析相对路径，使文件工具与 bash 中的 cd 保持一致
+
+    没有常驻 shell 或其目录与进程工作目录相同时原样返回
+    """
+    session = _active_shell.get()
+    if session is None or os.path.isabs(path):
+        return path
+    cwd = session.working_directory
+    if cwd == os.getcwd():
+        return path
+    return os.path.normpath(os.path.join(cwd, path))
+
 
-def register_tool(name: str, description: str, parameters: dict):
-    """工具注册装饰器"""
+def register_tool(name: str, description: str, parameters: dict, parallel_safe: bool = False):
+    """
+    工具注册装饰器
+
+    Args:
+        name: 工具名称
+        description: 工具描述
+        parameters: JSON Schema 格式的参数定义
+        parallel_safe: 是否可与其他工具并发执行；默认 False 按顺序执行，只读、无副作用的工具显式设为 True
+    """
     def decorator(func: Callable):
+        global _registry_version
         TOOLS[name] = {
             "name": name,
             "description": description,
             "parameters": parameters,
-            "handler": func
+            "handler": func,
+            "parallel_safe": parallel_safe
         }
+        _registry_version += 1
+        _schema_cache.clear()
         return func
     return decorator
 
@@ -35,56 +168,558 @@ def register_tool(name: str, description: str, parameters: dict):
             }
         },
         "required": ["command"]
-    }
+    },
+    parallel_safe=False
 )
 def bash_tool(command: str) -> str:
-    """执行 shell 命令"""
+    """执行 shell 命令，存在常驻 shell 会话时在会话中执行"""
+    session = _active_shell.get()
+    limits = {
+        "timeout": BASH_TIMEOUT,
+        "head_bytes": BASH_OUTPUT_HEAD_BYTES,
+        "tail_bytes": BASH_OUTPUT_TAIL_BYTES,
+        "max_output_bytes": BASH_MAX_OUTPUT_BYTES,
+    }
     try:
-        result = subprocess.run(
+        if session is not None:
+            result = session.run(command, **limits)
+        else:
+            result = run_command(command, **limits)
+        output = _format_bash_output(result.stdout, result.stderr, result.returncode)
+        if result.output_limited:
+            output += f"\n[错误]: 输出超过上限（{BASH_MAX_OUTPUT_BYTES} 字节），进程已终止"
+        if session is not None and not session.alive:
+            # 命令中执行了 exit 或输出超限，下一条命令将启动新的 shell
+            output += f"\n[shell 会话已结束，下一条命令将在新会话中执行，{_SESSION_RESET_NOTE}]"
+        return output
+    except ShellTimeout:
+        if session is not None:
+            return f"[错误]: 命令执行超时（{BASH_TIMEOUT}秒），shell 会话已重置，{_SESSION_RESET_NOTE}"
+        return f"[错误]: 命令执行超时（{BASH_TIMEOUT}秒）"
+    except Exception as e:
+        return f"[错误]: {str(e)}"
+    finally:
+        _note_fs_change()
+
+
+_SESSION_RESET_NOTE = "工作目录、环境变量和激活的虚拟环境已恢复为初始状态"
+
+
+def _format_bash_output(stdout: str, stderr: str, returncode: int) -> str:
+    """拼接命令输出、stderr 和退出码"""
+    output = stdout
+    if stderr:
+        output += f"\n[stderr]: {stderr}"
+    if returncode != 0:
+        output += f"\n[exit code]: {returncode}"
+    return output if output.strip() else "[命令执行成功，无输出]"
+
+
+class BackgroundJob:
+    """
+    后台任务
+
+    stdout 与 stderr 合并写入一个按字节偏移寻址的缓冲区，只保留最近
+    JOB_OUTPUT_BUFFER_BYTES 字节；游标为从任务开始计算的绝对偏移。
+    """
+
+    def __init__(self, job_id: int, command: str, cwd: Optional[str] = None):
+        self.id = job_id
+        self.command = command
+        self.started_at = time.time()
+        self.ended_at: Optional[float] = None
+        self.killed = False
+        self.process = subprocess.Popen(
             command,
             shell=True,
-            capture_output=True,
-            text=True,
-            timeout=60
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            cwd=cwd,
+            start_new_session=True,
         )
-        output = result.stdout
-        if result.stderr:
-            output += f"\n[stderr]: {result.stderr}"
-        if result.returncode != 0:
-            output += f"\n[exit code]: {result.returncode}"
-        return output if output.strip() else "[命令执行成功，无输出]"
-    except subprocess.TimeoutExpired:
-        return "[错误]: 命令执行超时（60秒）"
+        # buffer[0] 对应的绝对偏移
+        self.base = 0
+        self.buffer = bytearray()
+        self.cond = threading.Condition()
+        self.eof = False
+        threading.Thread(target=self._reader, daemon=True).start()
+        threading.Thread(target=self._waiter, daemon=True).start()
+
+    def _waiter(self):
+        self.process.wait()
+        self.ended_at = time.time()
+
+    def _reader(self):
+        fd = self.process.stdout.fileno()
+        while True:
+            try:
+                chunk = os.read(fd, 65536)
+            except OSError:
+                chunk = b""
+            with self.cond:
+                if not chunk:
+                    self.eof = True
+                    self.process.stdout.close()
+                    self.cond.notify_all()
+                    return
+                self.buffer += chunk
+                overflow = len(self.buffer) - JOB_OUTPUT_BUFFER_BYTES
+                if overflow > 0:
+                    del self.buffer[:overflow]
+                    self.base += overflow
+
+    @property
+    def total_bytes(self) -> int:
+        return self.base + len(self.buffer)
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self.process.poll()
+
+    def wait(self, timeout: float) -> bool:
+        """等待任务结束，返回是否已结束"""
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return False
+        # 输出读取线程可能稍晚于进程退出
+        with self.cond:
+            self.cond.wait_for(lambda: self.eof, timeout=1)
+        return True
+
+    def kill(self):
+        """终止任务的整个进程组"""
+        if self.returncode is None:
+            self.killed = True
+            kill_process_group(self.process)
+        self.wait(timeout=5)
+
+    def read(self, cursor: int, max_bytes: int) -> tuple[bytes, int, int]:
+        """
+        从游标位置读取输出
+
+        Returns:
+            (输出, 新游标, 因缓冲区滚动而跳过的字节数)
+        """
+        with self.cond:
+            skipped = max(0, self.base - cursor)
+            # 起始偏移在锁内按当前 base 计算，读取线程随后滚动缓冲区也不影响新游标
+            offset = max(cursor, self.base)
+            start = offset - self.base
+            data = bytes(self.buffer[start:start + max_bytes])
+        # 不在多字节 UTF-8 字符中间截断，剩余部分留给下一次读取
+        if len(data) == max_bytes:
+            data = data[:_utf8_boundary(data) or len(data)]
+        return data, offset + len(data), skipped
+
+    def describe(self) -> str:
+        """一行状态描述"""
+        returncode = self.returncode
+        if returncode is None:
+            state = "运行中"
+        elif self.killed:
+            state = "已终止"
+        else:
+            state = f"已结束 (exit code {returncode})"
+        end = self.ended_at or time.time()
+        return (
+            f"[job {self.id}] {state}，已运行 {end - self.started_at:.1f} 秒，"
+            f"输出 {self.total_bytes} 字节 | {self.command}"
+        )
+
+
+def _utf8_boundary(data: bytes) -> int:
+    """返回不截断末尾多字节 UTF-8 字符的最大长度"""
+    for i in range(1, min(4, len(data)) + 1):
+        byte = data[-i]
+        if byte & 0xC0 == 0x80:
+            continue
+        length = 4 if byte >= 0xF0 else 3 if byte >= 0xE0 else 2 if byte >= 0xC0 else 1
+        return len(data) - i if length > i else len(data)
+    return len(data)
+
+
+def _get_job(job_id: int) -> BackgroundJob:
+    with _jobs_lock:
+        job = _jobs.get(int(job_id))
+        if job is not None:
+            _jobs.move_to_end(job.id)
+    if job is None:
+        raise ValueError(f"后台任务不存在: {job_id}")
+    return job
+
+
+def _prune_jobs():
+    """已结束的任务超过 JOB_MAX_FINISHED 个时，移除最久未访问的，释放其输出缓冲区（调用方持有锁）"""
+    finished = [job_id for job_id, job in _jobs.items() if job.returncode is not None]
+    for job_id in finished[:max(0, len(finished) - JOB_MAX_FINISHED)]:
+        del _jobs[job_id]
+
+
+@atexit.register
+def _kill_all_jobs():
+    """退出时终止仍在运行的后台任务，避免遗留孤儿进程"""
+    with _jobs_lock:
+        jobs = list(_jobs.values())
+    for job in jobs:
+        if job.returncode is None:
+            kill_process_group(job.process)
+
+
+@register_tool(
+    name="job_start",
+    description="在后台启动长时间运行的 shell 命令（如构建、测试），立即返回任务 ID，不阻塞后续步骤。stdout 与 stderr 合并记录。",
+    parameters={
+        "type": "object",
+        "properties": {
+            "command": {
+                "type": "string",
+                "description": "要执行的 shell 命令"
+            }
+        },
+        "required": ["command"]
+    },
+    parallel_safe=False
+)
+def job_start_tool(command: str) -> str:
+    """在后台启动命令"""
+    global _next_job_id
+    with _jobs_lock:
+        running = sum(1 for job in _jobs.values() if job.returncode is None)
+        if running >= JOB_MAX_RUNNING:
+            return f"[错误]: 运行中的后台任务已达上限（{JOB_MAX_RUNNING} 个）"
+        job_id = _next_job_id
+        _next_job_id += 1
+    try:
+        # 存在常驻 shell 时在其当前目录启动，与之前的 cd 保持一致
+        session = _active_shell.get()
+        cwd = session.working_directory if session is not None else None
+        job = BackgroundJob(job_id, command, cwd=cwd)
+    except Exception as e:
+        return f"[错误]: {str(e)}"
+    with _jobs_lock:
+        _jobs[job_id] = job
+        _prune_jobs()
+    _note_fs_change()
+    return f"[已启动后台任务] job_id: {job_id} (pid {job.process.pid})"
+
+
+@register_tool(
+    name="job_status",
+    description="查看后台任务状态。不指定 job_id 时列出所有任务。",
+    parameters={
+        "type": "object",
+        "properties": {
+            "job_id": {
+                "type": "integer",
+                "description": "任务 ID"
+            }
+        },
+        "required": []
+    },
+    parallel_safe=True
+)
+def job_status_tool(job_id: Optional[int] = None) -> str:
+    """查看后台任务状态"""
+    try:
+        if job_id is not None:
+            return _get_job(job_id).describe()
+        with _jobs_lock:
+            jobs = list(_jobs.values())
+        if not jobs:
+            return "[没有后台任务]"
+        return "\n".join(job.describe() for job in jobs)
+    except Exception as e:
+        return f"[错误]: {str(e)}"
+
+
+@register_tool(
+    name="job_output",
+    description="增量读取后台任务的输出。传入上次返回的 next_cursor 只获取新增部分。",
+    parameters={
+        "type": "object",
+        "properties": {
+            "job_id": {
+                "type": "integer",
+                "description": "任务 ID"
+            },
+            "cursor": {
+                "type": "integer",
+                "description": "起始字节偏移，默认 0（从头读取）"
+            },
+            "max_bytes": {
+                "type": "integer",
+                "description": f"最多读取的字节数，默认 {JOB_OUTPUT_CHUNK_BYTES}"
+            }
+        },
+        "required": ["job_id"]
+    },
+    parallel_safe=True
+)
+def job_output_tool(job_id: int, cursor: int = 0, max_bytes: int = JOB_OUTPUT_CHUNK_BYTES) -> str:
+    """从游标位置读取后台任务输出"""
+    try:
+        job = _get_job(job_id)
+        data, next_cursor, skipped = job.read(max(0, cursor), max(1, min(max_bytes, JOB_OUTPUT_CHUNK_BYTES)))
+        output = ""
+        if skipped:
+            output += f"...[已滚出缓冲区 {skipped} 字节]...\n"
+        output += data.decode("utf-8", errors="replace")
+        remaining = job.total_bytes - next_cursor
+        output += f"\n[next_cursor]: {next_cursor}"
+        if remaining > 0:
+            output += f"（还有 {remaining} 字节未读）"
+        return f"{output}\n{job.describe()}"
+    except Exception as e:
+        return f"[错误]: {str(e)}"
+
+
+@register_tool(
+    name="job_wait",
+    description="等待后台任务结束，最多等待 timeout 秒，返回任务状态。",
+    parameters={
+        "type": "object",
+        "properties": {
+            "job_id": {
+                "type": "integer",
+                "description": "任务 ID"
+            },
+            "timeout": {
+                "type": "number",
+                "description": f"最长等待秒数，默认 30，最大 {JOB_WAIT_MAX}"
+            }
+        },
+        "required": ["job_id"]
+    },
+    parallel_safe=True
+)
+def job_wait_tool(job_id: int, timeout: float = 30) -> str:
+    """等待后台任务结束"""
+    try:
+        job = _get_job(job_id)
+        if not job.wait(max(0, min(timeout, JOB_WAIT_MAX))):
+            return f"[等待超时，任务仍在运行]\n{job.describe()}"
+        return job.describe()
+    except Exception as e:
+        return f"[错误]: {str(e)}"
+
+
+@register_tool(
+    name="job_kill",
+    description="终止后台任务（包括其所有子进程）。",
+    parameters={
+        "type": "object",
+        "properties": {
+            "job_id": {
+                "type": "integer",
+                "description": "任务 ID"
+            }
+        },
+        "required": ["job_id"]
+    },
+    parallel_safe=False
+)
+def job_kill_tool(job_id: int) -> str:
+    """终止后台任务"""
+    try:
+        job = _get_job(job_id)
+        job.kill()
+        return job.describe()
     except Exception as e:
         return f"[错误]: {str(e)}"
 
 
 @register_tool(
     name="read_file",
-    description="读取文件内容。用于查看代码、配置文件等。",
+    description=(
+        "读取文件内容。用于查看代码、配置文件等。大文件按窗口读取：offset/limit 按行（从 1 开始），"
+        "byte_offset/byte_limit 按字节；超出单次上限时会提示下一次的 offset。"
+    ),
     parameters={
         "type": "object",
         "properties": {
             "path": {
                 "type": "string",
                 "description": "文件路径"
+            },
+            "offset": {
+                "type": "integer",
+                "description": "起始行号（从 1 开始），默认 1"
+            },
+            "limit": {
+                "type": "integer",
+                "description": f"读取的行数，默认且最多 {READ_FILE_MAX_LINES}"
+            },
+            "byte_offset": {
+                "type": "integer",
+                "description": "按字节读取的起始偏移，指定后忽略 offset/limit"
+            },
+            "byte_limit": {
+                "type": "integer",
+                "description": f"按字节读取的长度，默认且最多 {READ_FILE_MAX_BYTES}"
             }
         },
         "required": ["path"]
-    }
+    },
+    parallel_safe=True
 )
-def read_file_tool(path: str) -> str:
-    """读取文件"""
+def read_file_tool(
+    path: str,
+    offset: Optional[int] = None,
+    limit: Optional[int] = None,
+    byte_offset: Optional[int] = None,
+    byte_limit: Optional[int] = None
+) -> str:
+    """读取文件，可按行或字节范围读取"""
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        return content if content else "[文件为空]"
+        path = _resolve_path(path)
+        if os.path.getsize(path) < READ_FILE_MMAP_THRESHOLD:
+            data, key = FILE_CACHE.read(path)
+            return _read_window(data, key, offset, limit, byte_offset, byte_limit, count_newlines=data.count)
+        with open(path, 'rb') as f:
+            fd = f.fileno()
+            key = file_key(path, os.fstat(fd))
+            if key[3] == 0:
+                return "[文件为空]"
+            # 大文件通过 mmap 访问，只有实际读取的窗口会被载入内存；
+            # 行数统计分块 pread，不经过 mmap，避免整个文件驻留内存
+            with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as buf:
+                return _read_window(
+                    buf, key, offset, limit, byte_offset, byte_limit,
+                    count_newlines=lambda sub, start, end: os.pread(fd, end - start, start).count(sub)
+                )
     except FileNotFoundError:
         return f"[错误]: 文件不存在: {path}"
     except Exception as e:
         return f"[错误]: {str(e)}"
 
 
+def _read_window(
+    buf,
+    key: tuple,
+    offset: Optional[int],
+    limit: Optional[int],
+    byte_offset: Optional[int],
+    byte_limit: Optional[int],
+    count_newlines: Callable[[bytes, int, int], int]
+) -> str:
+    """在文件内容（bytes 或 mmap）上读取指定窗口"""
+    size = key[3]
+    if size == 0:
+        return "[文件为空]"
+    if byte_offset is not None or byte_limit is not None:
+        return _read_byte_range(buf, size, byte_offset or 0, byte_limit)
+    if offset is None and limit is None and b"\0" in buf[:8192]:
+        return f"[二进制文件，共 {size} 字节]: 可使用 byte_offset/byte_limit 按字节读取"
+    total, checkpoints = _line_index(key, count_newlines)
+    return _read_line_range(buf, size, total, checkpoints, offset or 1, limit)
+
+
+def _read_byte_range(buf, size: int, start: int, length: Optional[int]) -> str:
+    """按字节范围读取"""
+    if start < 0 or start >= size:
+        return f"[错误]: byte_offset 超出文件范围（共 {size} 字节）"
+    length = READ_FILE_MAX_BYTES if length is None else max(1, min(length, READ_FILE_MAX_BYTES))
+    end = min(size, start + length)
+    content = buf[start:end].decode("utf-8", errors="replace")
+    footer = f"{_footer_separator(content)}[字节 {start}-{end}，共 {size} 字节"
+    if end < size:
+        footer += f"。使用 byte_offset={end} 继续读取"
+    return content + footer + "]"
+
+
+def _footer_separator(content: str) -> str:
+    """内容与范围说明之间空一行"""
+    return "\n" if content.endswith("\n") else "\n\n"
+
+
+def _line_index(key: tuple, count_newlines: Callable[[bytes, int, int], int]) -> tuple[int, list[int]]:
+    """
+    获取文件的行索引（按文件标识缓存）
+
+    Args:
+        key: 文件标识
+        count_newlines: 统计 [start, end) 范围内子串出现次数，签名同 bytes.count
+
+    Returns:
+        (总行数, 每个 _LINE_INDEX_CHUNK 字节分块起点之前的换行符数)
+    """
+    with _line_index_lock:
+        cached = _line_index_cache.get(key)
+        if cached is not None:
+            _line_index_cache.move_to_end(key)
+            return cached
+    size = key[3]
+    checkpoints = []
+    newlines = 0
+    for start in range(0, size, _LINE_INDEX_CHUNK):
+        checkpoints.append(newlines)
+        newlines += count_newlines(b"\n", start, min(size, start + _LINE_INDEX_CHUNK))
+    total = newlines + (0 if count_newlines(b"\n", size - 1, size) else 1)
+    with _line_index_lock:
+        _line_index_cache[key] = (total, checkpoints)
+        while len(_line_index_cache) > _LINE_INDEX_CACHE_SIZE:
+            _line_index_cache.popitem(last=False)
+    return total, checkpoints
+
+
+def _skip_lines(buf, pos: int, n: int, end: int) -> Optional[int]:
+    """从 pos 开始跳过 n 行，返回下一行的起始偏移；[pos, end) 内不足 n 个换行符时返回 None"""
+    parts = buf[pos:end].split(b"\n", n)
+    if len(parts) <= n:
+        return None
+    return end - len(parts[-1])
+
+
+def _line_start(buf, size: int, checkpoints: list[int], line: int) -> int:
+    """返回第 line 行（从 1 开始）的起始字节偏移"""
+    skip = line - 1
+    if skip == 0:
+        return 0
+    # 找到包含第 skip 个换行符的分块，只在该分块内查找
+    chunk = bisect.bisect_left(checkpoints, skip) - 1
+    pos = chunk * _LINE_INDEX_CHUNK
+    return _skip_lines(buf, pos, skip - checkpoints[chunk], min(size, pos + _LINE_INDEX_CHUNK))
+
+
+def _read_line_range(buf, size: int, total: int, checkpoints: list[int], offset: int, limit: Optional[int]) -> str:
+    """按行范围读取，超出字节上限时在行边界处截断"""
+    if offset < 1 or offset > total:
+        return f"[错误]: offset 超出文件范围（共 {total} 行）"
+    limit = READ_FILE_MAX_LINES if limit is None else max(1, min(limit, READ_FILE_MAX_LINES))
+    if offset == 1 and total <= limit and size <= READ_FILE_MAX_BYTES:
+        return buf[:].decode("utf-8", errors="replace")
+    start = _line_start(buf, size, checkpoints, offset)
+    window_end = min(size, start + READ_FILE_MAX_BYTES)
+
+    end = _skip_lines(buf, start, limit, window_end)
+    if end is not None:
+        lines = limit
+    else:
+        if window_end == size:
+            end = size
+        else:
+            # 下一行超出字节上限，留给下一次读取；单行就超出上限时截断该行
+            newline = buf.rfind(b"\n", start, window_end)
+            end = newline + 1 if newline != -1 else window_end
+        lines = buf[start:end].count(b"\n")
+        if buf[end - 1:end] != b"\n":
+            lines += 1
+
+    content = buf[start:end].decode("utf-8", errors="replace")
+    last = offset + lines - 1
+    if offset == 1 and end >= size:
+        return content
+    footer = f"{_footer_separator(content)}[第 {offset}-{last} 行，共 {total} 行"
+    if end < size:
+        if end > 0 and buf[end - 1:end] != b"\n":
+            footer += f"。第 {last} 行超出单次读取上限，使用 byte_offset={end} 继续读取"
+        else:
+            footer += f"。使用 offset={last + 1} 继续读取"
+    return content + footer + "]"
+
+
 @register_tool(
     name="write_file",
     description="写入内容到文件。用于创建或修改文件。",
@@ -101,17 +736,21 @@ def read_file_tool(path: str) -> str:
             }
         },
         "required": ["path", "content"]
-    }
+    },
+    parallel_safe=False
 )
 def write_file_tool(path: str, content: str) -> str:
     """写入文件"""
     try:
+        path = _resolve_path(path)
         # 确保目录存在
         dir_path = os.path.dirname(path)
         if dir_path:
             os.makedirs(dir_path, exist_ok=True)
         with open(path, 'w', encoding='utf-8') as f:
             f.write(content)
+        FILE_CACHE.invalidate(path)
+        _note_fs_change()
         return f"[成功]: 已写入 {len(content)} 字符到 {path}"
     except Exception as e:
         return f"[错误]: {str(e)}"
@@ -119,32 +758,90 @@ def write_file_tool(path: str, content: str) -> str:
 
 @register_tool(
     name="list_dir",
-    description="列出目录内容。用于探索文件结构。",
+    description=(
+        "列出目录内容。用于探索文件结构。可递归列出子目录，结果分页返回。"
+        "默认隐藏 .gitignore/.ignore 忽略的条目、隐藏目录及 node_modules 等依赖目录。"
+    ),
     parameters={
         "type": "object",
         "properties": {
             "path": {
                 "type": "string",
                 "description": "目录路径，默认为当前目录"
+            },
+            "max_depth": {
+                "type": "integer",
+                "description": f"递归深度，1 表示只列出当前目录，默认 1，最大 {LIST_DIR_MAX_DEPTH}"
+            },
+            "sort": {
+                "type": "string",
+                "enum": ["name", "size", "mtime"],
+                "description": "排序方式：name 按名称，size 按大小（大的在前），mtime 按修改时间（新的在前），默认 name"
+            },
+            "page_size": {
+                "type": "integer",
+                "description": f"每页条目数，默认且最多 {LIST_DIR_PAGE_SIZE}"
+            },
+            "cursor": {
+                "type": "integer",
+                "description": "从第几个条目开始（上一页返回的 cursor），默认 0"
+            },
+            "show_ignored": {
+                "type": "boolean",
+                "description": "同时列出被忽略的条目，默认 false"
             }
         },
         "required": []
-    }
+    },
+    parallel_safe=True
 )
-def list_dir_tool(path: str = ".") -> str:
+def list_dir_tool(
+    path: str = ".",
+    max_depth: int = 1,
+    sort: str = "name",
+    page_size: int = LIST_DIR_PAGE_SIZE,
+    cursor: int = 0,
+    show_ignored: bool = False
+) -> str:
     """列出目录"""
     try:
-        entries = os.listdir(path)
+        path = _resolve_path(path)
+        if sort not in ("name", "size", "mtime"):
+            return f"[错误]: 不支持的排序方式: {sort}"
+        max_depth = max(1, min(max_depth, LIST_DIR_MAX_DEPTH))
+        page_size = max(1, min(page_size, LIST_DIR_PAGE_SIZE))
+        cursor = max(0, cursor)
+        entries = _scan_dir(path, sort)
         if not entries:
             return "[目录为空]"
+        matcher = rules = None
+        if not show_ignored:
+            matcher = _get_ignore_matcher(path)
+            entries, rules = _filter_ignored(entries, "", matcher, matcher.root_rules())
+            if not entries:
+                return "[目录中只有被忽略的条目，使用 show_ignored=true 列出]"
+
+        # 多取一项用于判断是否还有下一页
+        walker = _walk_entries(entries, "", 1, max_depth, sort, matcher, rules)
+        page = list(itertools.islice(walker, cursor, cursor + page_size + 1))
+        has_more = len(page) > page_size
+        page = page[:page_size]
+        if not page:
+            return "[错误]: cursor 超出范围"
+
         result = []
-        for entry in sorted(entries):
-            full_path = os.path.join(path, entry)
-            if os.path.isdir(full_path):
-                result.append(f"📁 {entry}/")
+        for entry, rel_path, is_dir in page:
+            if is_dir:
+                result.append(f"📁 {rel_path}/")
             else:
-                size = os.path.getsize(full_path)
-                result.append(f"📄 {entry} ({size} bytes)")
+                result.append(f"📄 {rel_path} ({_entry_stat(entry, 'st_size')} bytes)")
+        if has_more or cursor:
+            end = cursor + len(page)
+            total = f"，共 {len(entries)} 项" if max_depth == 1 else ""
+            footer = f"[第 {cursor + 1}-{end} 项{total}"
+            if has_more:
+                footer += f"。使用 cursor={end} 继续"
+            result.append(footer + "]")
         return "\n".join(result)
     except FileNotFoundError:
         return f"[错误]: 目录不存在: {path}"
@@ -152,80 +849,624 @@ def list_dir_tool(path: str = ".") -> str:
         return f"[错误]: {str(e)}"
 
 
+def _entry_stat(entry: os.DirEntry, field: str) -> int:
+    """读取 DirEntry 缓存的 stat 字段，失效的符号链接等返回 0"""
+    try:
+        return getattr(entry.stat(), field)
+    except OSError:
+        return 0
+
+
+def _scan_dir(path: str, sort: str) -> list[os.DirEntry]:
+    """扫描单个目录并排序；size/mtime 排序只对需要的条目调用 stat"""
+    with os.scandir(path) as it:
+        entries = list(it)
+    if sort == "size":
+        entries.sort(key=lambda e: (-_entry_stat(e, "st_size"), e.name))
+    elif sort == "mtime":
+        entries.sort(key=lambda e: (-_entry_stat(e, "st_mtime_ns"), e.name))
+    else:
+        entries.sort(key=lambda e: e.name)
+    return entries
+
+
+def _walk_entries(
+    entries: list[os.DirEntry],
+    prefix: str,
+    depth: int,
+    max_depth: int,
+    sort: str,
+    matcher: Optional[IgnoreMatcher] = None,
+    rules: Optional[IgnoreRules] = None
+) -> Iterator[tuple[os.DirEntry, str, bool]]:
+    """深度优先遍历，惰性展开子目录；不跟随指向目录的符号链接，给出 matcher 时跳过被忽略的条目"""
+    for entry in entries:
+        rel_path = prefix + entry.name
+        is_dir = entry.is_dir()
+        yield entry, rel_path, is_dir
+        if is_dir and depth < max_depth and not entry.is_symlink():
+            try:
+                children = _scan_dir(entry.path, sort)
+            except OSError:
+                continue
+            child_rules = None
+            if matcher is not None:
+                children, child_rules = _filter_ignored(children, rel_path, matcher, rules)
+            yield from _walk_entries(children, rel_path + "/", depth + 1, max_depth, sort, matcher, child_rules)
+
+
 @register_tool(
     name="search_files",
-    description="在目录中搜索文件。用于查找特定文件。",
+    description="在目录中搜索文件。用于查找特定文件。跳过 .gitignore/.ignore 忽略的文件和隐藏目录。结果分页返回，并注明是否还有更多结果。",
     parameters={
         "type": "object",
         "properties": {
             "pattern": {
                 "type": "string",
-                "description": "搜索模式（支持 * 通配符）"
+                "description": "搜索模式（支持 * 通配符，不含通配符时按文件名精确匹配；含 / 时匹配相对路径，** 匹配任意层级目录，如 src/**/*.py）"
             },
             "path": {
                 "type": "string",
                 "description": "搜索目录，默认为当前目录"
+            },
+            "limit": {
+                "type": "integer",
+                "description": f"最多返回的结果数，默认 {SEARCH_DEFAULT_LIMIT}，最大 {SEARCH_MAX_LIMIT}"
+            },
+            "offset": {
+                "type": "integer",
+                "description": "跳过前 offset 个结果，用于翻页，默认 0"
+            },
+            "max_depth": {
+                "type": "integer",
+                "description": "最大目录深度，1 表示只搜索当前目录，默认不限"
             }
         },
         "required": ["pattern"]
-    }
+    },
+    parallel_safe=True
 )
-def search_files_tool(pattern: str, path: str = ".") -> str:
-    """搜索文件"""
-    import fnmatch
-    try:
-        matches = []
-        for root, dirs, files in os.walk(path):
-            # 跳过隐藏目录和常见的忽略目录
-            dirs[:] = [d for d in dirs if not d.startswith('.') and d not in ['node_modules', '__pycache__', 'venv']]
-            for filename in files:
-                if fnmatch.fnmatch(filename, pattern):
-                    matches.append(os.path.join(root, filename))
+def search_files_tool(
+    pattern: str,
+    path: str = ".",
+    limit: int = SEARCH_DEFAULT_LIMIT,
+    offset: int = 0,
+    max_depth: Optional[int] = None
+) -> str:
+    """搜索文件，找到足够的结果后立即停止"""
+    try:
+        path = _resolve_path(path)
+        if not os.path.isdir(path):
+            return f"[错误]: 目录不存在: {path}"
+        limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+        offset = max(0, offset)
+        query = SearchQuery(pattern)
+        if FILE_INDEX_ENABLED and max_depth is None and _file_index_warm(path):
+            candidates = _get_file_index(path).search(query)
+        else:
+            # 限制深度或索引尚未建立时惰性遍历，只访问需要的目录
+            candidates = (
+                rel_path for rel_path in _walk_files(path, max_depth)
+                if query.matches(rel_path.rsplit("/", 1)[-1], rel_path)
+            )
+        # 多取一个用于判断结果是否被截断
+        page = list(itertools.islice(candidates, offset, offset + limit + 1))
+        truncated = len(page) > limit
+        matches = [os.path.join(path, rel_path) for rel_path in page[:limit]]
         if not matches:
+            if offset:
+                return f"[没有更多匹配 '{pattern}' 的文件]"
             return f"[未找到匹配 '{pattern}' 的文件]"
-        return "\n".join(matches[:50])  # 限制结果数量
+        if truncated:
+            end = offset + len(matches)
+            matches.append(f"[结果已截断：显示第 {offset + 1}-{end} 个，使用 offset={end} 查看更多]")
+        return "\n".join(matches)
+    except Exception as e:
+        return f"[错误]: {str(e)}"
+
+
+def _get_ignore_matcher(path: str) -> IgnoreMatcher:
+    """获取根目录的忽略规则（按根目录缓存，忽略文件的编译结果随之复用）"""
+    root = os.path.abspath(path)
+    with _ignore_matchers_lock:
+        matcher = _ignore_matchers.get(root)
+        if matcher is None:
+            matcher = IgnoreMatcher(root, IGNORE_DEFAULT_PATTERNS, IGNORE_FILES)
+            _ignore_matchers[root] = matcher
+        return matcher
+
+
+def _filter_ignored(
+    entries: list[os.DirEntry],
+    rel: str,
+    matcher: IgnoreMatcher,
+    parent_rules: IgnoreRules
+) -> tuple[list[os.DirEntry], IgnoreRules]:
+    """
+    过滤目录中被忽略的条目
+
+    Args:
+        entries: 目录 rel 中的条目
+        rel: 目录相对根目录的路径，根目录为 ""
+        matcher: 根目录的忽略规则
+        parent_rules: 上一级目录生效的规则
+
+    Returns:
+        (未被忽略的条目, 该目录生效的规则)
+    """
+    rules = matcher.dir_rules(rel, {entry.name for entry in entries}, parent_rules)
+    prefix = f"{rel}/" if rel else ""
+    return [entry for entry in entries if not rules.ignored(prefix + entry.name, entry.is_dir())], rules
+
+
+def _walk_files(path: str, max_depth: Optional[int] = None) -> Iterator[str]:
+    """
+    惰性深度优先遍历目录树，返回未被忽略的文件的相对路径（与文件索引的顺序一致）
+
+    Args:
+        path: 目录路径
+        max_depth: 最大深度，超出的子目录不再进入
+    """
+    matcher = _get_ignore_matcher(path)
+    yield from _walk_tree(path, "", 1, max_depth, matcher, matcher.root_rules())
+
+
+def _walk_tree(
+    path: str,
+    rel: str,
+    depth: int,
+    max_depth: Optional[int],
+    matcher: IgnoreMatcher,
+    parent_rules: IgnoreRules
+) -> Iterator[str]:
+    """_walk_files 的递归部分，被忽略的目录不再进入；不进入目录符号链接"""
+    with os.scandir(path) as it:
+        entries = list(it)
+    rules = matcher.dir_rules(rel, {entry.name for entry in entries}, parent_rules)
+    prefix = f"{rel}/" if rel else ""
+    files, subdirs = [], []
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            subdirs.append(entry.name)
+        elif not entry.is_dir():
+            files.append(entry.name)
+    for name in sorted(rules.filter(prefix, files, False)):
+        yield prefix + name
+    if max_depth is not None and depth >= max_depth:
+        return
+    for name in sorted(rules.filter(prefix, subdirs, True)):
+        try:
+            yield from _walk_tree(os.path.join(path, name), prefix + name, depth + 1, max_depth, matcher, rules)
+        except OSError:
+            continue
+
+
+def _file_index_warm(path: str) -> bool:
+    """
+    判断 search_files 是否应使用文件索引
+
+    建立索引需要遍历整个目录树，不受 limit 限制；因此根目录首次搜索时改为惰性遍历，
+    只记录该根目录，再次搜索时才建立索引。已在内存中或已持久化的索引直接使用。
+    """
+    root = os.path.abspath(path)
+    with _file_indexes_lock:
+        if root in _file_indexes or root in _file_index_pending:
+            _file_index_pending.pop(root, None)
+            return True
+        if FILE_INDEX_DIR and os.path.exists(index_db_path(FILE_INDEX_DIR, root)):
+            return True
+        _file_index_pending[root] = None
+        while len(_file_index_pending) > FILE_INDEX_MAX_ROOTS:
+            _file_index_pending.popitem(last=False)
+        return False
+
+
+def _get_file_index(path: str) -> FileIndex:
+    """
+    获取根目录的文件索引并按需刷新
+
+    上次刷新后没有执行过可能修改文件的工具、没有运行中的后台任务，
+    且距上次刷新不超过 FILE_INDEX_REFRESH_INTERVAL 秒时直接复用，不再 stat 目录。
+    """
+    root = os.path.abspath(path)
+    evicted: list[FileIndex] = []
+    with _file_indexes_lock:
+        index = _file_indexes.get(root)
+        if index is None:
+            db_path = index_db_path(FILE_INDEX_DIR, root) if FILE_INDEX_DIR else None
+            index = FileIndex(
+                root, db_path,
+                ignore=_get_ignore_matcher(root),
+                signature=repr((IGNORE_DEFAULT_PATTERNS, IGNORE_FILES))
+            )
+            _file_indexes[root] = index
+            while len(_file_indexes) > FILE_INDEX_MAX_ROOTS:
+                old_root, old_index = _file_indexes.popitem(last=False)
+                _file_index_generations.pop(old_root, None)
+                evicted.append(old_index)
+        else:
+            _file_indexes.move_to_end(root)
+        generation = _fs_generation
+        fresh = (
+            _file_index_generations.get(root) == generation
+            and time.monotonic() - index.last_refresh < FILE_INDEX_REFRESH_INTERVAL
+            and not _has_running_jobs()
+        )
+    # 被淘汰的索引可能仍在刷新，在锁外关闭其数据库连接（持久化的索引下次可从磁盘加载）
+    for old_index in evicted:
+        old_index.close()
+    if not fresh:
+        index.refresh()
+        with _file_indexes_lock:
+            _file_index_generations[root] = generation
+    return index
+
+
+def _has_running_jobs() -> bool:
+    with _jobs_lock:
+        return any(job.returncode is None for job in _jobs.values())
+
+
+def _note_fs_change():
+    """记录一次可能修改文件系统的操作，使文件索引在下次搜索时重新校验"""
+    global _fs_generation
+    with _file_indexes_lock:
+        _fs_generation += 1
+
+
+@register_tool(
+    name="grep",
+    description=(
+        "按正则表达式搜索文件内容，返回 文件:行号: 内容。用于查找函数定义、调用位置、配置项等，"
+        "比逐个 read_file 更省上下文。遵循与 search_files 相同的忽略规则，跳过二进制文件。"
+    ),
+    parameters={
+        "type": "object",
+        "properties": {
+            "pattern": {
+                "type": "string",
+                "description": "正则表达式（Python re 语法），逐行匹配：^ 和 $ 匹配行首行尾，匹配不跨行"
+            },
+            "path": {
+                "type": "string",
+                "description": "搜索目录，默认为当前目录"
+            },
+            "glob": {
+                "type": "string",
+                "description": "只搜索匹配的文件，语法同 search_files 的 pattern，如 *.py 或 src/**/*.ts"
+            },
+            "ignore_case": {
+                "type": "boolean",
+                "description": "忽略大小写，默认 false"
+            },
+            "fixed_strings": {
+                "type": "boolean",
+                "description": "将 pattern 视为普通字符串而非正则，默认 false"
+            },
+            "context": {
+                "type": "integer",
+                "description": f"每处匹配前后显示的行数，默认 0，最大 {GREP_MAX_CONTEXT}"
+            },
+            "max_results": {
+                "type": "integer",
+                "description": f"最多返回的匹配数，默认 {GREP_DEFAULT_MAX_RESULTS}，最大 {GREP_MAX_RESULTS}"
+            }
+        },
+        "required": ["pattern"]
+    },
+    parallel_safe=True
+)
+def grep_tool(
+    pattern: str,
+    path: str = ".",
+    glob: Optional[str] = None,
+    ignore_case: bool = False,
+    fixed_strings: bool = False,
+    context: int = 0,
+    max_results: int = GREP_DEFAULT_MAX_RESULTS
+) -> str:
+    """搜索文件内容，多线程并行扫描，匹配数达到上限后停止"""
+    try:
+        path = _resolve_path(path)
+        if not os.path.isdir(path):
+            return f"[错误]: 目录不存在: {path}"
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+        try:
+            regex = re.compile(re.escape(pattern) if fixed_strings else pattern, flags)
+        except re.error as e:
+            return f"[错误]: 无效的正则表达式: {e}"
+        # 纯 ASCII 的模式另编译一份 bytes 版本，用于纯 ASCII 文件，免去解码；
+        # \u、\N 等只有 str 正则支持的转义编译失败时全部按 str 匹配
+        ascii_regex = None
+        if regex.pattern.isascii():
+            try:
+                ascii_regex = re.compile(regex.pattern.encode("ascii"), flags)
+            except re.error:
+                pass
+        context = max(0, min(context, GREP_MAX_CONTEXT))
+        max_results = max(1, min(max_results, GREP_MAX_RESULTS))
+
+        query = SearchQuery(glob or "")
+        if FILE_INDEX_ENABLED:
+            candidates = _get_file_index(path).search(query)
+        else:
+            candidates = (
+                rel_path for rel_path in _walk_files(path)
+                if query.matches(rel_path.rsplit("/", 1)[-1], rel_path)
+            )
+
+        output: list[str] = []
+        matched_files = 0
+        total = 0
+        truncated = False
+        # re 匹配时持有 GIL，多线程主要用于重叠文件读取（网络挂载的工作区收益明显）
+        with ThreadPoolExecutor(max_workers=GREP_WORKERS) as executor:
+            # 按文件顺序分批提交、按顺序收集结果，最多同时排队 GREP_WORKERS * 2 批
+            pending: deque[Future] = deque()
+            files = iter(candidates)
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < GREP_WORKERS * 2:
+                    batch = [os.path.join(path, rel_path) for rel_path in itertools.islice(files, GREP_BATCH_SIZE)]
+                    exhausted = len(batch) < GREP_BATCH_SIZE
+                    if batch:
+                        pending.append(executor.submit(_grep_files, batch, regex, ascii_regex, context, max_results))
+                if not pending:
+                    break
+                for blocks in pending.popleft().result():
+                    if not blocks:
+                        continue
+                    if total + len(blocks) > max_results:
+                        blocks = blocks[:max_results - total]
+                        truncated = True
+                    matched_files += 1
+                    total += len(blocks)
+                    if output and context:
+                        output.append("--")
+                    output.extend(line for block in blocks for line in block)
+                    if total >= max_results:
+                        break
+                if total >= max_results:
+                    # 达到上限后不再检查剩余文件，是否还有更多匹配未知，按已截断处理
+                    truncated = True
+                    for future in pending:
+                        future.cancel()
+                    break
+
+        if not output:
+            return f"[未找到匹配 '{pattern}' 的内容]"
+        if truncated:
+            output.append(f"[已达到上限 {total} 处匹配，结果可能不完整，可缩小搜索范围或使用 glob 过滤文件]")
+        else:
+            output.append(f"[{matched_files} 个文件中共 {total} 处匹配]")
+        return "\n".join(output)
     except Exception as e:
         return f"[错误]: {str(e)}"
 
 
+def _grep_files(
+    file_paths: list[str],
+    regex: re.Pattern,
+    ascii_regex: Optional[re.Pattern],
+    context: int,
+    max_matches: int
+) -> list[list[list[str]]]:
+    """在一批文件中搜索，批量提交以减少线程池调度开销"""
+    return [_grep_file(file_path, regex, ascii_regex, context, max_matches) for file_path in file_paths]
+
+
+def _grep_file(
+    file_path: str,
+    regex: re.Pattern,
+    ascii_regex: Optional[re.Pattern],
+    context: int,
+    max_matches: int
+) -> list[list[str]]:
+    """
+    在单个文件中搜索
+
+    Args:
+        regex: 按字符匹配的 str 正则
+        ascii_regex: 同一模式的 bytes 正则（模式含非 ASCII 字符时为 None）
+
+    Returns:
+        每处匹配的输出行块（含上下文）；二进制文件和无法读取的文件返回空列表
+    """
+    try:
+        stat = os.stat(file_path)
+        if stat.st_size == 0:
+            return []
+        if stat.st_size < READ_FILE_MMAP_THRESHOLD:
+            buf, _ = FILE_CACHE.read(file_path, stat)
+            return _grep_content(buf, file_path, regex, ascii_regex, context, max_matches)
+        with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return _grep_content(buf, file_path, regex, ascii_regex, context, max_matches)
+    except (OSError, ValueError):
+        return []
+
+
+_NON_ASCII_BYTE = re.compile(rb"[\x80-\xff]")
+
+
+def _grep_content(
+    buf,
+    file_path: str,
+    regex: re.Pattern,
+    ascii_regex: Optional[re.Pattern],
+    context: int,
+    max_matches: int
+) -> list[list[str]]:
+    """
+    在文件内容（bytes 或 mmap）中搜索：跳过二进制文件；纯 ASCII 文件直接用 bytes 正则匹配，
+    其他文件按 UTF-8 解码后用 str 正则匹配，使 .、[^x]、{n}、\w 和忽略大小写按字符而非字节计算
+    """
+    if b"\0" in buf[:8192]:
+        return []
+    if ascii_regex is not None:
+        is_ascii = buf.isascii() if isinstance(buf, bytes) else _NON_ASCII_BYTE.search(buf) is None
+        if is_ascii:
+            return _grep_buffer(buf, file_path, ascii_regex, context, max_matches)
+    return _grep_buffer(buf[:].decode("utf-8", errors="replace"), file_path, regex, context, max_matches)
+
+
+def _grep_buffer(buf, file_path: str, regex: re.Pattern, context: int, max_matches: int) -> list[list[str]]:
+    """
+    在文件内容（bytes、mmap 或已解码的 str）中搜索
+
+    对整个内容运行正则作为预筛选，只为命中的行计算行号和上下文；命中后在该行范围内重新匹配，
+    跨行的匹配（如 \s 匹配到换行）不计入。regex 须与 buf 同为 bytes 或 str。
+    """
+    newline = "\n" if isinstance(buf, str) else b"\n"
+    size = len(buf)
+    blocks: list[list[str]] = []
+    line_no = 1
+    counted_to = 0
+    # 已输出到的行号，上下文不重复输出，不相邻的块之间插入 --
+    printed_to = 0
+    pos = 0
+    while len(blocks) < max_matches and pos < size:
+        match = regex.search(buf, pos)
+        if match is None:
+            break
+        start = buf.rfind(newline, 0, match.start()) + 1
+        end = buf.find(newline, match.start())
+        end = size if end == -1 else end
+        if match.end() > end and regex.search(buf, start, end) is None:
+            # 匹配跨越了行尾，且该行内没有其他匹配
+            pos = end + 1
+            continue
+        line_no += buf[counted_to:start].count(newline)
+        counted_to = start
+
+        block = []
+        before = []
+        cursor = start
+        while len(before) < context and cursor > 0 and line_no - len(before) - 1 > printed_to:
+            prev_start = buf.rfind(newline, 0, cursor - 1) + 1
+            before.append(_grep_line(file_path, line_no - len(before) - 1, "-", buf[prev_start:cursor - 1]))
+            cursor = prev_start
+        first = line_no - len(before)
+        if context and printed_to and first > printed_to + 1:
+            block.append("--")
+        block.extend(reversed(before))
+        block.append(_grep_line(file_path, line_no, ":", buf[start:end]))
+        printed_to = line_no
+
+        # 向后取上下文，遇到下一处匹配所在的行时停止，由下一次循环输出
+        cursor = end + 1
+        while printed_to - line_no < context and cursor < size:
+            next_end = buf.find(newline, cursor)
+            next_end = size if next_end == -1 else next_end
+            text = buf[cursor:next_end]
+            if regex.search(text):
+                break
+            printed_to += 1
+            block.append(_grep_line(file_path, printed_to, "-", text))
+            cursor = next_end + 1
+        blocks.append(block)
+        # 同一行只报告一次
+        pos = end + 1
+    return blocks
+
+
+def _grep_line(file_path: str, line_no: int, sep: str, text) -> str:
+    """格式化一行输出（text 为 bytes 或 str），过长的行截断"""
+    if isinstance(text, bytes):
+        text = text.decode("utf-8", errors="replace")
+    line = text.rstrip("\r")
+    if len(line) > GREP_MAX_LINE_CHARS:
+        line = line[:GREP_MAX_LINE_CHARS] + "..."
+    return f"{file_path}{sep}{line_no}{sep} {line}"
+
+
 @register_tool(
     name="calculator",
-    description="执行数学计算。用于数值计算。",
+    description="执行数学计算。用于数值计算。支持算术、比较运算和 math 模块的函数与常量（如 sqrt、log、factorial、pi）。",
     parameters={
         "type": "object",
         "properties": {
             "expression": {
                 "type": "string",
-                "description": "数学表达式，如 '2 + 3 * 4'"
+                "description": "数学表达式，如 '2 + 3 * 4'、'sqrt(2) * pi'、'math.log(1024, 2)'"
             }
         },
         "required": ["expression"]
-    }
+    },
+    parallel_safe=True
 )
 def calculator_tool(expression: str) -> str:
     """计算器"""
     try:
-        # 安全地执行数学表达式
-        allowed_names = {"abs": abs, "round": round, "min": min, "max": max, "sum": sum, "pow": pow}
-        result = eval(expression, {"__builtins__": {}}, allowed_names)
-        return str(result)
+        # 解析为 AST 后在白名单内求值，不使用 eval；编译结果按表达式缓存
+        return str(evaluate(expression))
     except Exception as e:
         return f"[错误]: 无法计算 '{expression}': {str(e)}"
 
 
-def get_tools_for_llm() -> list[dict]:
-    """获取 LLM 格式的工具定义"""
-    return [
-        {
-            "type": "function",
-            "function": {
-                "name": tool["name"],
-                "description": tool["description"],
-                "parameters": tool["parameters"]
+def select_tools(names: Optional[Iterable[str]] = None) -> dict[str, dict]:
+    """
+    按名称选取工具子集
+
+    Args:
+        names: 工具名称列表，None 表示全部工具
+
+    Returns:
+        名称 -> 工具定义，保持注册表中的顺序
+    """
+    if names is None:
+        return dict(TOOLS)
+    wanted = set(names)
+    unknown = wanted - TOOLS.keys()
+    if unknown:
+        raise ValueError(f"未知工具: {', '.join(sorted(unknown))}")
+    return {name: tool for name, tool in TOOLS.items() if name in wanted}
+
+
+def get_registry_version() -> int:
+    """获取注册表版本号"""
+    return _registry_version
+
+
+def _get_schemas(names: Optional[Iterable[str]]) -> tuple[list[dict], bytes]:
+    """按 (版本号, 子集) 缓存工具定义及其 JSON 序列化结果"""
+    subset = None if names is None else tuple(sorted(set(names)))
+    key = (_registry_version, subset)
+    cached = _schema_cache.get(key)
+    if cached is None:
+        schemas = [
+            {
+                "type": "function",
+                "function": {
+                    "name": tool["name"],
+                    "description": tool["description"],
+                    "parameters": tool["parameters"]
+                }
             }
-        }
-        for tool in TOOLS.values()
-    ]
+            for tool in select_tools(subset).values()
+        ]
+        data = json.dumps(schemas, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        cached = _schema_cache[key] = (schemas, data)
+    return cached
+
+
+def get_tools_for_llm(names: Optional[Iterable[str]] = None) -> list[dict]:
+    """
+    获取 LLM 格式的工具定义，可只取指定名称的子集
+
+    结果按注册表版本缓存，同一版本下每次返回同一个列表，调用方不应修改。
+    """
+    return _get_schemas(names)[0]
+
+
+def get_tools_json(names: Optional[Iterable[str]] = None) -> bytes:
+    """获取规范化序列化后的工具定义（与 get_tools_for_llm 同步缓存），用于缓存键和请求体复用"""
+    return _get_schemas(names)[1]
+
+
+def is_parallel_safe(name: str) -> bool:
+    """工具是否可以并发执行，未知工具视为可并发（只会返回错误信息）"""
+    tool = TOOLS.get(name)
+    return tool is None or tool.get("parallel_safe", False)
 
 
 def execute_tool(name: str, arguments: dict) -> str:
@@ -235,7 +1476,31 @@ def execute_tool(name: str, arguments: dict) -> str:
     
     tool = TOOLS[name]
     try:
-        return tool["handler"](**arguments)
+        result = tool["handler"](**arguments)
+        if inspect.isawaitable(result):
+            # 协程工具在同步模式下单独运行一个事件循环
+            result = asyncio.run(result)
+        return result
+    except TypeError as e:
+        return f"[错误]: 工具参数错误: {str(e)}"
+    except Exception as e:
+        return f"[错误]: 工具执行失败: {str(e)}"
+
+
+async def aexecute_tool(name: str, arguments: dict) -> str:
+    """
+    异步执行工具
+    
+    协程工具直接 await；同步工具放到线程池中执行，避免阻塞事件循环。
+    """
+    if name not in TOOLS:
+        return f"[错误]: 未知工具 '{name}'"
+    
+    handler = TOOLS[name]["handler"]
+    try:
+        if inspect.iscoroutinefunction(handler):
+            return await handler(**arguments)
+        return await asyncio.to_thread(handler, **arguments)
     except TypeError as e:
         return f"[错误]: 工具参数错误: {str(e)}"
     except Exception as e:
@@ -0,0 +1,162 @@
+"""
+链路追踪模块 - 记录每次运行、迭代、LLM 调用和工具调用的耗时
+每个结束的 Span 以 OTLP JSON 的 ExportTraceServiceRequest 格式（resourceSpans）逐行写入本地文件
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+# 写入 scope 的插桩名称
+SCOPE_NAME = "react-mini"
+# 未指定输出文件时内存中保留的 span 数上限
+DEFAULT_MAX_SPANS = 10000
+
+# 当前活动的 span，用于自动建立父子关系
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+def _otlp_value(value: Any) -> dict:
+    """将 Python 值转换为 OTLP AnyValue"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """一个计时区间"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+        """设置属性，值为 None 的属性会被忽略"""
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    @property
+    def duration(self) -> float:
+        """耗时（秒）"""
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e9
+
+    def to_otlp(self) -> dict:
+        """转换为 OTLP JSON 格式的 span（不含 resource/scope 外层）"""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": "SPAN_KIND_INTERNAL",
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": k, "value": _otlp_value(v)}
+                for k, v in self.attributes.items()
+            ],
+            "status": {"code": "STATUS_CODE_ERROR", "message": self.error} if self.error else {"code": "STATUS_CODE_OK"},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class Tracer:
+    """
+    追踪器
+
+    通过 span() 上下文管理器记录耗时，嵌套调用自动成为子 span。
+    结束的 span 以 JSON Lines 格式追加到 path 指定的文件，每行是一个可直接提交给
+    OTLP/HTTP JSON 接口的 {"resourceSpans": [...]} 请求体。
+    """
+
+    def __init__(self, path: Optional[str] = None, service_name: str = "react-mini", max_spans: int = DEFAULT_MAX_SPANS):
+        """
+        初始化追踪器
+
+        Args:
+            path: 输出文件路径，为 None 时只保存在内存中（spans 属性）
+            service_name: 写入 resource 的服务名
+            max_spans: 只保存在内存中时保留的最近 span 数，更早的被丢弃
+        """
+        self.path = path
+        self.service_name = service_name
+        self.spans: deque[Span] = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """
+        记录一个 span
+
+        Args:
+            name: span 名称，如 agent.run / llm.call / tool.execute
+            **attributes: 初始属性
+        """
+        parent = _current_span.get()
+        trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        span = Span(name, trace_id, parent.span_id if parent else None, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current_span.reset(token)
+            self._export(span)
+
+    def to_otlp(self, spans: list[Span]) -> dict:
+        """将 span 包装为 OTLP JSON 的 ExportTraceServiceRequest"""
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{
+                    "scope": {"name": SCOPE_NAME},
+                    "spans": [span.to_otlp() for span in spans],
+                }],
+            }]
+        }
+
+    def _export(self, span: Span):
+        """保存并写出已结束的 span"""
+        with self._lock:
+            if self.path is None:
+                self.spans.append(span)
+                return
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self.to_otlp([span]), ensure_ascii=False) + "\n")
+
+
+class NullTracer:
+    """不记录任何内容的追踪器，未配置追踪时使用"""
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        yield _NULL_SPAN
+
+
+class _NullSpan(Span):
+    def __init__(self):
+        super().__init__("null", "", None, {})
+
+    def set(self, **attributes):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+NULL_TRACER = NullTracer()